@@ -0,0 +1,185 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+# Lower value = served first. Fast-path requests jump ahead of long GPT-4 style routes.
+TIER_PRIORITIES: Dict[str, int] = {"fast": 0, "default": 1, "complex": 2}
+
+
+class AdmissionRejected(Exception):
+    """The provider queue is full or the request would miss its deadline; answer 503 + Retry-After."""
+    def __init__(self, provider: str, reason: str, retry_after: int) -> None:
+        super().__init__(f"{provider}: {reason}")
+        self.provider = provider
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ProviderQueue:
+    def __init__(self, provider: str, concurrency: int, max_queue: int, deadline: float) -> None:
+        """
+        Concurrency limit with a bounded priority wait queue for one provider.
+        """
+        self.provider = provider
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.in_flight: int = 0
+        self.admitted: int = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "deadline": 0}
+        self.waits: Deque[float] = deque(maxlen=200)
+        self.service_time: Optional[float] = None  # EWMA of provider call duration (seconds)
+        self._waiters: List[List[Any]] = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    def estimated_wait(self, ahead: Optional[int] = None) -> Optional[float]:
+        """Expected queueing time for a request with `ahead` waiters in front of it (None if unknown)."""
+        if self.service_time is None:
+            return None
+        ahead = self.depth if ahead is None else ahead
+        return (ahead // self.concurrency + 1) * self.service_time if self.in_flight >= self.concurrency else 0.0
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.estimated_wait() or self.deadline / 2))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        return AdmissionRejected(self.provider, reason, self._retry_after())
+
+    async def acquire(self, priority: int) -> None:
+        start = time.monotonic()
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            self._admit(start)
+            return
+
+        if self.depth >= self.max_queue:
+            raise self._reject("queue_full")
+
+        # Deadline-aware shedding: don't queue a request that would time out anyway
+        ahead = sum(1 for waiter in self._waiters if waiter[0] <= priority)
+        expected = self.estimated_wait(ahead)
+        if expected is not None and expected > self.deadline:
+            raise self._reject("deadline")
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), future]
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.deadline - (time.monotonic() - start))
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._remove(entry)
+                raise self._reject("deadline")
+            # The slot was handed over just as the deadline hit: keep it
+        except asyncio.CancelledError:
+            # Client went away: give back the slot if it was already handed over
+            if future.done():
+                self.release()
+            else:
+                self._remove(entry)
+            raise
+        self._admit(start)
+
+    def _admit(self, start: float) -> None:
+        self.admitted += 1
+        self.waits.append(time.monotonic() - start)
+
+    def _remove(self, entry: List[Any]) -> None:
+        entry[2].cancel()
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        if service_time is not None:
+            self.service_time = service_time if self.service_time is None else 0.8 * self.service_time + 0.2 * service_time
+        # Hand the slot straight to the highest-priority waiter (in_flight stays the same)
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        waits = sorted(self.waits)
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.depth,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "wait_avg_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "wait_p95_ms": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))] * 1000, 1) if waits else 0.0,
+            "service_time_ms": round(self.service_time * 1000, 1) if self.service_time is not None else None,
+        }
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Runs a blocking provider SDK call in a thread, like asyncio.to_thread.
+
+    A thread cannot be interrupted, so when the awaiting request is cancelled (client
+    went away) this keeps waiting for the call to finish before re-raising: the
+    admission slot around it stays held for as long as the provider is actually busy.
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+    cancelled = False
+    while not task.done():
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            cancelled = True
+        except Exception:
+            break
+    if cancelled:
+        if not task.cancelled():
+            task.exception()  # Retrieved: the result is dropped with the request
+        raise asyncio.CancelledError()
+    return task.result()
+
+
+class AdmissionController:
+    def __init__(self) -> None:
+        """
+        Per-provider admission control.
+
+        Configuration (env): ADMISSION_CONCURRENCY (default 4, per provider override
+        ADMISSION_CONCURRENCY_<PROVIDER>), ADMISSION_QUEUE_SIZE (default 16) and
+        ADMISSION_DEADLINE_SECONDS (max queueing time, default 20).
+        """
+        self.default_concurrency: int = int(os.getenv("ADMISSION_CONCURRENCY", "4"))
+        self.max_queue: int = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+        self.deadline: float = float(os.getenv("ADMISSION_DEADLINE_SECONDS", "20"))
+        self.queues: Dict[str, ProviderQueue] = {}
+
+    def queue(self, provider: str) -> ProviderQueue:
+        if provider not in self.queues:
+            concurrency = int(os.getenv(f"ADMISSION_CONCURRENCY_{provider.upper()}", str(self.default_concurrency)))
+            self.queues[provider] = ProviderQueue(provider, max(1, concurrency), self.max_queue, self.deadline)
+        return self.queues[provider]
+
+    @asynccontextmanager
+    async def slot(self, provider: str, tier: Optional[str] = None) -> AsyncIterator[None]:
+        """Waits for a provider slot (raises AdmissionRejected when shed) and holds it for the block."""
+        queue = self.queue(provider)
+        await queue.acquire(TIER_PRIORITIES.get(tier or "default", 1))
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            queue.release(time.monotonic() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {provider: queue.snapshot() for provider, queue in self.queues.items()}
@@ -0,0 +1,94 @@
+"""
+Offline knowledge base index builder.
+
+Builds a versioned, checksummed index artifact from docs/ (and PocketBase knowledge docs)
+that the service memory-maps read-only at startup instead of re-embedding on boot:
+
+    python build_index.py                               # docs/ -> ai_service/index/<version>
+    python build_index.py --pocketbase                  # + download knowledge_docs from PocketBase
+    python build_index.py --pocketbase-export ./export  # + previously exported PocketBase docs
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+from typing import Any, Dict, List
+from dotenv import load_dotenv
+from knowledge_base import KnowledgeBase, DEFAULT_INDEX_PATH, SERVICE_DIR, Source, knowledge_doc_metadata
+from index_artifact import IndexArtifact, gc_versions, DEFAULT_KEEP_VERSIONS
+
+RECORDS_FILE = "records.json"
+
+
+def pocketbase_source(export_dir: str) -> Source:
+    """A PocketBase export directory; records.json (if present) provides role/tenant metadata."""
+    file_metadata: Dict[str, Dict[str, Any]] = {}
+    records_path = os.path.join(export_dir, RECORDS_FILE)
+    if os.path.exists(records_path):
+        with open(records_path, "r", encoding="utf-8") as f:
+            for record in json.load(f):
+                if record.get("file"):
+                    file_metadata[record["file"]] = knowledge_doc_metadata(record, record["file"])
+    return (export_dir, "pocketbase", file_metadata)
+
+
+async def export_from_pocketbase(dest_dir: str) -> int:
+    from pocketbase_client import PocketBaseClient
+    pb = PocketBaseClient()
+    await pb.authenticate()
+    records: List[Dict[str, Any]] = await pb.export_knowledge_docs(dest_dir)
+    with open(os.path.join(dest_dir, RECORDS_FILE), "w", encoding="utf-8") as f:
+        json.dump(records, f)
+    await pb.client.aclose()
+    return len(records)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build the knowledge base index artifact offline")
+    parser.add_argument("--docs", default=os.path.join(os.path.dirname(SERVICE_DIR), "docs"), help="markdown docs directory")
+    parser.add_argument("--pocketbase-export", action="append", default=[], metavar="DIR",
+                        help="directory of exported PocketBase knowledge docs (repeatable)")
+    parser.add_argument("--pocketbase", action="store_true", help="download knowledge_docs from PocketBase first")
+    parser.add_argument("--out", default=os.getenv("KB_INDEX_PATH", DEFAULT_INDEX_PATH), help="index root directory")
+    parser.add_argument("--keep", type=int, default=int(os.getenv("KB_INDEX_KEEP", str(DEFAULT_KEEP_VERSIONS))),
+                        help="number of index versions to keep (env KB_INDEX_KEEP)")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(os.path.dirname(SERVICE_DIR), ".env"))
+
+    sources: List[Source] = []
+    if os.path.isdir(args.docs):
+        sources.append((args.docs, "repo", None))
+    else:
+        print(f"[WARN] Docs directory not found: {args.docs}")
+    sources.extend(pocketbase_source(d) for d in args.pocketbase_export)
+
+    with tempfile.TemporaryDirectory() as download_dir:
+        if args.pocketbase:
+            count = asyncio.run(export_from_pocketbase(download_dir))
+            print(f"Downloaded {count} documents from PocketBase.")
+            sources.append(pocketbase_source(download_dir))
+
+        if not sources:
+            print("❌ Nothing to index.")
+            return 1
+
+        kb = KnowledgeBase(index_path=args.out)
+        try:
+            version_dir = kb.build_index(sources)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+
+    index = IndexArtifact.load(version_dir)
+    print(f"✅ Built index {index.version}: {len(index)} chunks, dim {index.manifest['dim']} -> {version_dir}")
+    removed = gc_versions(args.out, keep=args.keep)
+    if removed:
+        print(f"Removed old versions: {', '.join(removed)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import os
+import re
+import math
+import hashlib
+from typing import Any, Callable, Dict, List, Optional
+
+EMBEDDING_TOKENIZER = "sentence-transformers/all-MiniLM-L6-v2"
+# MiniLM's max sequence length includes the [CLS] and [SEP] tokens added at embedding time
+EMBEDDING_MAX_TOKENS = 256
+SPECIAL_TOKENS = 2
+
+HEADERS_TO_SPLIT_ON = [("#", "h1"), ("##", "h2"), ("###", "h3")]
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def load_token_counter(tokenizer_name: str = EMBEDDING_TOKENIZER) -> Callable[[str], int]:
+    """
+    Returns a token counter for the embedding model's tokenizer (chunks beyond its
+    max sequence length get truncated at embedding time): transformers, else the
+    model's tokenizer.json through `tokenizers`.
+
+    Falls back to tiktoken, then to a ~4 chars/token estimate. Both undercount MiniLM's
+    WordPiece tokens, so their counts are inflated by APPROX_TOKEN_MARGIN (env, default
+    1.25), which shrinks the effective chunk budget accordingly.
+    """
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception as e:
+        print(f"[WARN] transformers tokenizer {tokenizer_name} unavailable ({e}), trying tokenizers")
+    try:
+        from tokenizers import Tokenizer
+        fast_tokenizer = Tokenizer.from_pretrained(tokenizer_name)
+        # tokenizer.json ships with truncation enabled, which would cap the counts
+        fast_tokenizer.no_truncation()
+        fast_tokenizer.no_padding()
+        return lambda text: len(fast_tokenizer.encode(text, add_special_tokens=False).ids)
+    except Exception as e:
+        print(f"[WARN] Tokenizer {tokenizer_name} unavailable ({e}), falling back to tiktoken")
+
+    margin: float = float(os.getenv("APPROX_TOKEN_MARGIN", "1.25"))
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: math.ceil(len(encoding.encode(text, disallowed_special=())) * margin)
+    except Exception as e:
+        print(f"[WARN] tiktoken unavailable ({e}), estimating tokens from characters")
+    # Round up: rounding short words down to 0 tokens would let the splitter build unbounded chunks
+    return lambda text: max(1, math.ceil(len(text) / 4 * margin))
+
+
+class MarkdownChunker:
+    def __init__(
+        self,
+        chunk_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        token_counter: Optional[Callable[[str], int]] = None
+    ) -> None:
+        """
+        Heading-aware, token-sized markdown chunking.
+
+        Documents are split on #/##/### headings; oversized sections are split recursively
+        and consecutive small pieces are packed together, so every chunk stays within
+        chunk_tokens (env CHUNK_TOKENS, default 254 = MiniLM's 256-token max sequence length
+        minus [CLS]/[SEP]). Overlap (env CHUNK_OVERLAP_TOKENS) only applies inside split sections.
+        A packed chunk's section lists every heading it covers.
+        """
+        from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+
+        self.chunk_tokens: int = chunk_tokens or int(os.getenv("CHUNK_TOKENS", str(EMBEDDING_MAX_TOKENS - SPECIAL_TOKENS)))
+        self.overlap_tokens: int = overlap_tokens if overlap_tokens is not None else int(os.getenv("CHUNK_OVERLAP_TOKENS", "16"))
+        self.count_tokens: Callable[[str], int] = token_counter or load_token_counter()
+        self.header_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS_TO_SPLIT_ON, strip_headers=False)
+        self.section_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_tokens,
+            chunk_overlap=self.overlap_tokens,
+            length_function=self.count_tokens,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+
+    def split(self, text: str) -> List[Dict[str, Any]]:
+        """Returns chunks as {"text", "section", "tokens"} dicts."""
+        # 1. Heading sections, with oversized ones pre-split into pieces
+        units: List[Dict[str, Any]] = []
+        for section in self.header_splitter.split_text(text):
+            content: str = section.page_content.strip()
+            if not content:
+                continue
+            heading: str = " > ".join(section.metadata[key] for _, key in HEADERS_TO_SPLIT_ON if key in section.metadata)
+            tokens: int = self.count_tokens(content)
+            if tokens <= self.chunk_tokens:
+                units.append({"text": content, "section": heading, "tokens": tokens})
+            else:
+                for piece in self.section_splitter.split_text(content):
+                    units.append({"text": piece, "section": heading, "tokens": self.count_tokens(piece)})
+
+        # 2. Pack consecutive units (small sections, split tails) up to chunk_tokens
+        chunks: List[Dict[str, Any]] = []
+        sections: List[List[str]] = []
+        for unit in units:
+            if chunks and chunks[-1]["tokens"] + unit["tokens"] <= self.chunk_tokens:
+                # Recount the joined text: the separator costs tokens too
+                joined: str = chunks[-1]["text"] + "\n\n" + unit["text"]
+                tokens = self.count_tokens(joined)
+                if tokens <= self.chunk_tokens:
+                    chunks[-1]["text"] = joined
+                    chunks[-1]["tokens"] = tokens
+                    if unit["section"] and unit["section"] not in sections[-1]:
+                        sections[-1].append(unit["section"])
+                    continue
+            chunks.append(dict(unit))
+            sections.append([unit["section"]] if unit["section"] else [])
+        for chunk, chunk_sections in zip(chunks, sections):
+            chunk["section"] = " | ".join(chunk_sections)
+        return chunks
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """64-bit SimHash over word shingles."""
+    words = WORD_RE.findall(text.lower())
+    shingles = [" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))]
+    weights = [0] * 64
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+class NearDuplicateFilter:
+    def __init__(self, max_distance: Optional[int] = None) -> None:
+        """
+        Detects near-duplicate chunks by SimHash Hamming distance (env NEAR_DUP_MAX_DISTANCE, default 3).
+
+        Fingerprints are split into max_distance + 1 bands; two fingerprints within
+        max_distance bits must share at least one band, so only same-band candidates are compared.
+        """
+        self.max_distance: int = max_distance if max_distance is not None else int(os.getenv("NEAR_DUP_MAX_DISTANCE", "3"))
+        self.bands: int = self.max_distance + 1
+        self.band_bits: int = 64 // self.bands
+        self.buckets: Dict[tuple, List[tuple]] = {}
+
+    def _band_keys(self, fingerprint: int) -> List[tuple]:
+        mask = (1 << self.band_bits) - 1
+        return [(band, fingerprint >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def find_or_add(self, text: str, key: Any) -> Optional[Any]:
+        """
+        Returns the key of an already-seen near-duplicate of text, or None
+        (in which case text is remembered under key).
+        """
+        fingerprint = simhash(text)
+        band_keys = self._band_keys(fingerprint)
+        for band_key in band_keys:
+            for other, other_key in self.buckets.get(band_key, []):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                    return other_key
+        for band_key in band_keys:
+            self.buckets.setdefault(band_key, []).append((fingerprint, key))
+        return None
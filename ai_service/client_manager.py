@@ -1,71 +1,100 @@
 import os
-from typing import Optional, Dict, Any
-import openai
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-load_dotenv()
+import threading
+from typing import Optional, Dict, Any, Callable, List
 
 class ClientManager:
     def __init__(self):
+        """
+        Provider clients are created (and their SDKs imported) on first use.
+        Which providers are available is decided from configuration alone, so a deployment
+        that only uses Ollama never imports google.generativeai.
+        """
         self.clients: Dict[str, Any] = {}
-        self._initialize_clients()
+        self.failed: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._factories: Dict[str, Callable[[], Any]] = self._configured_factories()
+
+    def _configured_factories(self) -> Dict[str, Callable[[], Any]]:
+        factories: Dict[str, Callable[[], Any]] = {}
 
-    def _initialize_clients(self):
         # 1. OpenAI
         if os.getenv("OPENAI_API_KEY"):
-            try:
-                self.clients["openai"] = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                print("[OK] OpenAI Client Initialized")
-            except Exception as e:
-                print(f"[WARN] OpenAI Init Failed: {e}")
+            factories["openai"] = self._create_openai
 
         # 2. Groq (Fast Inference)
         if os.getenv("GROQ_API_KEY"):
-            try:
-                self.clients["groq"] = openai.OpenAI(
-                    base_url="https://api.groq.com/openai/v1",
-                    api_key=os.getenv("GROQ_API_KEY")
-                )
-                print("[OK] Groq Client Initialized")
-            except Exception as e:
-                print(f"[WARN] Groq Init Failed: {e}")
+            factories["groq"] = self._create_groq
 
         # 3. OpenRouter (Aggregator)
         if os.getenv("OPENROUTER_API_KEY"):
-            try:
-                self.clients["openrouter"] = openai.OpenAI(
-                    base_url="https://openrouter.ai/api/v1",
-                    api_key=os.getenv("OPENROUTER_API_KEY"),
-                    default_headers={"HTTP-Referer": "https://growyourneed.com"}
-                )
-                print("[OK] OpenRouter Client Initialized")
-            except Exception as e:
-                print(f"[WARN] OpenRouter Init Failed: {e}")
+            factories["openrouter"] = self._create_openrouter
 
         # 4. Ollama (Local)
-        ollama_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
-        try:
-            # Simple check if reachable could be added here
-            self.clients["ollama"] = openai.OpenAI(
-                base_url=ollama_url,
-                api_key="ollama"
-            )
-            print(f"[OK] Ollama Client Configured ({ollama_url})")
-        except Exception as e:
-            print(f"[WARN] Ollama Init Failed: {e}")
+        factories["ollama"] = self._create_ollama
 
         # 5. Google Gemini
         if os.getenv("GEMINI_API_KEY"):
-            try:
-                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-                self.clients["gemini"] = genai.GenerativeModel('gemini-pro')
-                print("[OK] Gemini Client Initialized")
-            except Exception as e:
-                print(f"[WARN] Gemini Init Failed: {e}")
+            factories["gemini"] = self._create_gemini
+
+        return factories
+
+    def _create_openai(self) -> Any:
+        import openai
+        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        print("[OK] OpenAI Client Initialized")
+        return client
+
+    def _create_groq(self) -> Any:
+        import openai
+        client = openai.OpenAI(
+            base_url="https://api.groq.com/openai/v1",
+            api_key=os.getenv("GROQ_API_KEY")
+        )
+        print("[OK] Groq Client Initialized")
+        return client
+
+    def _create_openrouter(self) -> Any:
+        import openai
+        client = openai.OpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            default_headers={"HTTP-Referer": "https://growyourneed.com"}
+        )
+        print("[OK] OpenRouter Client Initialized")
+        return client
+
+    def _create_ollama(self) -> Any:
+        import openai
+        ollama_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
+        # Simple check if reachable could be added here
+        client = openai.OpenAI(
+            base_url=ollama_url,
+            api_key="ollama"
+        )
+        print(f"[OK] Ollama Client Configured ({ollama_url})")
+        return client
+
+    def _create_gemini(self) -> Any:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        client = genai.GenerativeModel('gemini-pro')
+        print("[OK] Gemini Client Initialized")
+        return client
 
     def get_client(self, provider: str) -> Any:
-        return self.clients.get(provider)
+        client = self.clients.get(provider)
+        if client is not None or provider not in self._factories or provider in self.failed:
+            return client
+
+        with self._lock:
+            if provider in self.clients or provider in self.failed:
+                return self.clients.get(provider)
+            try:
+                self.clients[provider] = self._factories[provider]()
+            except Exception as e:
+                self.failed[provider] = str(e)
+                print(f"[WARN] {provider} Init Failed: {e}")
+            return self.clients.get(provider)
 
-    def list_available_providers(self) -> list:
-        return list(self.clients.keys())
+    def list_available_providers(self) -> List[str]:
+        return [p for p in self._factories if p not in self.failed]
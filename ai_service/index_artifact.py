@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+INDEX_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl"
+CURRENT_FILE = "CURRENT"
+# Versions kept by gc_versions (build_index.py --keep and service refreshes; env KB_INDEX_KEEP)
+DEFAULT_KEEP_VERSIONS = 3
+
+
+class IndexArtifactError(Exception):
+    """The index artifact is missing, corrupt or incompatible."""
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_index(
+    out_root: str,
+    ids: List[str],
+    documents: List[str],
+    metadatas: List[Dict[str, Any]],
+    embeddings: np.ndarray,
+    model_name: str
+) -> str:
+    """
+    Writes a new versioned index artifact under out_root and points CURRENT at it.
+
+    Layout: <out_root>/<version>/{embeddings.npy, chunks.jsonl, manifest.json}, where
+    embeddings.npy holds L2-normalized float32 vectors (memory-mapped at load time) and
+    the manifest records the embedding model and SHA-256 checksums of both files.
+    Returns the version directory.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embeddings = embeddings / norms
+
+    content_hash = hashlib.sha256("\n".join(documents).encode("utf-8")).hexdigest()[:8]
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{content_hash}"
+    os.makedirs(out_root, exist_ok=True)
+    tmp_dir = os.path.join(out_root, f".tmp-{version}")
+    final_dir = os.path.join(out_root, version)
+    if os.path.exists(final_dir):
+        # Same content built within the same second: reuse it
+        set_current_version(out_root, version)
+        return final_dir
+    os.makedirs(tmp_dir)
+
+    try:
+        np.save(os.path.join(tmp_dir, EMBEDDINGS_FILE), embeddings)
+        with open(os.path.join(tmp_dir, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            for chunk_id, text, metadata in zip(ids, documents, metadatas):
+                f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata}, ensure_ascii=False) + "\n")
+
+        manifest = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "version": version,
+            "model": model_name,
+            "dim": int(embeddings.shape[1]) if len(embeddings) else 0,
+            "count": len(documents),
+            "created_at": int(time.time()),
+            "checksums": {name: _sha256(os.path.join(tmp_dir, name)) for name in (EMBEDDINGS_FILE, CHUNKS_FILE)},
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        os.replace(tmp_dir, final_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    set_current_version(out_root, version)
+    return final_dir
+
+
+def set_current_version(out_root: str, version: str) -> None:
+    """Atomically points <out_root>/CURRENT at version."""
+    tmp_path = os.path.join(out_root, f".{CURRENT_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, os.path.join(out_root, CURRENT_FILE))
+
+
+def list_versions(out_root: str) -> List[str]:
+    """Version directories under out_root, oldest first."""
+    if not os.path.isdir(out_root):
+        return []
+    return sorted(
+        name for name in os.listdir(out_root)
+        if not name.startswith(".") and os.path.exists(os.path.join(out_root, name, MANIFEST_FILE))
+    )
+
+
+def resolve_index_dir(path: str) -> Optional[str]:
+    """
+    Resolves path to a version directory: path itself if it holds a manifest, else the
+    version named in <path>/CURRENT, else the newest version. None if there is no index.
+    """
+    if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return path
+    current_path = os.path.join(path, CURRENT_FILE)
+    if os.path.exists(current_path):
+        with open(current_path, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        if os.path.exists(os.path.join(path, version, MANIFEST_FILE)):
+            return os.path.join(path, version)
+    versions = list_versions(path)
+    return os.path.join(path, versions[-1]) if versions else None
+
+
+def ensure_writable(out_root: str) -> None:
+    """Raises IndexArtifactError unless new versions can be written under out_root."""
+    try:
+        os.makedirs(out_root, exist_ok=True)
+        probe = os.path.join(out_root, f".write-probe-{os.getpid()}")
+        with open(probe, "w", encoding="utf-8"):
+            pass
+        os.remove(probe)
+    except OSError as e:
+        raise IndexArtifactError(f"Index directory {out_root} is not writable: {e}") from e
+
+
+def gc_versions(out_root: str, keep: int = DEFAULT_KEEP_VERSIONS) -> List[str]:
+    """Deletes all but the newest `keep` versions (never the CURRENT one). Returns removed versions."""
+    current = resolve_index_dir(out_root)
+    current_version = os.path.basename(current) if current else None
+    removed: List[str] = []
+    for version in list_versions(out_root)[:-keep] if keep > 0 else list_versions(out_root):
+        if version != current_version:
+            shutil.rmtree(os.path.join(out_root, version), ignore_errors=True)
+            removed.append(version)
+    return removed
+
+
+class IndexArtifact:
+    def __init__(self, path: str, manifest: Dict[str, Any], embeddings: np.ndarray, chunks: List[Dict[str, Any]]) -> None:
+        self.path = path
+        self.manifest = manifest
+        self.version: str = manifest["version"]
+        self.embeddings = embeddings
+        self.documents: List[str] = [c["text"] for c in chunks]
+        self.metadatas: List[Dict[str, Any]] = [c["metadata"] for c in chunks]
+        # Column arrays for vectorized metadata filtering
+        self._columns: Dict[str, np.ndarray] = {
+            key: np.array([m.get(key) for m in self.metadatas], dtype=object)
+            for key in ("role", "tenant", "origin")
+        }
+
+    @classmethod
+    def load(cls, path: str, model_name: Optional[str] = None, verify: bool = True) -> "IndexArtifact":
+        """
+        Opens a version directory read-only. The embedding matrix is memory-mapped, so
+        replicas loading the same file share its pages through the OS page cache.
+        """
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise IndexArtifactError(f"No index manifest at {path}")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest: Dict[str, Any] = json.load(f)
+
+        if manifest.get("format_version") != INDEX_FORMAT_VERSION:
+            raise IndexArtifactError(f"Unsupported index format {manifest.get('format_version')} at {path}")
+        if model_name and manifest.get("model") != model_name:
+            raise IndexArtifactError(f"Index at {path} was built with {manifest.get('model')}, service uses {model_name}")
+        if verify:
+            for name, checksum in manifest["checksums"].items():
+                if _sha256(os.path.join(path, name)) != checksum:
+                    raise IndexArtifactError(f"Checksum mismatch for {name} in {path}")
+
+        embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(path, CHUNKS_FILE), "r", encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+        if len(chunks) != embeddings.shape[0]:
+            raise IndexArtifactError(f"Index at {path} has {len(chunks)} chunks but {embeddings.shape[0]} vectors")
+        return cls(path, manifest, embeddings, chunks)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _mask(self, where: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Evaluates the subset of Chroma's where syntax produced by build_where ($and, $in, equality)."""
+        if not where:
+            return None
+        if "$and" in where:
+            mask = np.ones(len(self), dtype=bool)
+            for condition in where["$and"]:
+                mask &= self._mask(condition)
+            return mask
+        (key, condition), = where.items()
+        column = self._columns.get(key)
+        if column is None:
+            column = np.array([m.get(key) for m in self.metadatas], dtype=object)
+        if isinstance(condition, dict) and "$in" in condition:
+            return np.isin(column, condition["$in"])
+        return column == condition
+
+    def search(self, query_embedding: List[float], k: int = 3, where: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Exact cosine search. Returns (document, score) pairs, best first."""
+        if len(self) == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        # Only score the filtered partition
+        mask = self._mask(where or {})
+        if mask is None:
+            candidates = np.arange(len(self))
+            candidate_scores = self.embeddings @ query
+        else:
+            candidates = np.flatnonzero(mask)
+            if len(candidates) == 0:
+                return []
+            candidate_scores = self.embeddings[candidates] @ query
+        top = min(k, len(candidates))
+        best = np.argpartition(-candidate_scores, top - 1)[:top]
+        best = best[np.argsort(-candidate_scores[best])]
+        return [(self.documents[candidates[i]], float(candidate_scores[i])) for i in best]
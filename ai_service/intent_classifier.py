@@ -0,0 +1,238 @@
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
+import numpy as np
+
+EmbedFn = Callable[[List[str]], Sequence[Sequence[float]]]
+
+
+@dataclass(frozen=True)
+class Intent:
+    """
+    A user intent described by example phrases.
+
+    - tier: model tier to route to ("fast", "default" or "complex")
+    - sources: context sources the chat pipeline should fetch
+      ("kb", "pulse", "wellness", "users", "products")
+    - direct: whether the intent can be answered from PocketBase or a
+      template without an LLM call
+    """
+    name: str
+    examples: List[str]
+    tier: str = "default"
+    sources: FrozenSet[str] = frozenset({"kb", "pulse"})
+    direct: bool = False
+
+
+@dataclass
+class IntentMatch:
+    intent: Intent
+    confidence: float
+    margin: float
+    confident: bool
+    direct: bool
+    scores: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return self.intent.name
+
+
+# Used when nothing scores above the confidence threshold: the full RAG + LLM pipeline.
+GENERAL_INTENT = Intent(name="general", examples=[], tier="default", sources=frozenset({"kb", "pulse"}))
+
+DEFAULT_INTENTS: List[Intent] = [
+    Intent(
+        name="status",
+        examples=[
+            "what is the system status",
+            "is the service healthy",
+            "are all systems operational",
+            "run a health check",
+            "is the platform down right now",
+            "system health",
+        ],
+        tier="fast",
+        sources=frozenset(),
+        direct=True,
+    ),
+    Intent(
+        name="help",
+        examples=[
+            "help",
+            "what can you do",
+            "how can you help me",
+            "what are your capabilities",
+            "what features do you support",
+            "what kind of questions can I ask you",
+        ],
+        tier="fast",
+        sources=frozenset(),
+        direct=True,
+    ),
+    Intent(
+        name="greeting",
+        examples=[
+            "hello",
+            "hi there",
+            "good morning",
+            "thanks a lot",
+            "thank you",
+            "hey, how are you",
+        ],
+        tier="fast",
+        sources=frozenset(),
+    ),
+    Intent(
+        name="user_search",
+        examples=[
+            "search user john",
+            "find user alice@example.com",
+            "look up the account of maria",
+            "find the user named bob smith",
+            "search for a user called emma",
+            "which user has the email david@school.org",
+        ],
+        tier="fast",
+        sources=frozenset({"users"}),
+        direct=True,
+    ),
+    Intent(
+        name="product_list",
+        examples=[
+            "list products",
+            "show me all products",
+            "what products are in the marketplace",
+            "which items are for sale",
+            "show the latest products in the shop",
+            "list the marketplace catalog",
+        ],
+        tier="fast",
+        sources=frozenset({"products"}),
+        direct=True,
+    ),
+    Intent(
+        name="wellness",
+        examples=[
+            "how did I sleep this week",
+            "how many steps did I walk today",
+            "give me advice to improve my fitness",
+            "how has my mood been lately",
+            "how many calories did I burn",
+            "help me build a healthier routine",
+        ],
+        tier="default",
+        sources=frozenset({"kb", "wellness"}),
+    ),
+    Intent(
+        name="technical",
+        examples=[
+            "fix this typescript error",
+            "debug my react component",
+            "write a function that sorts the grades",
+            "explain the architecture of the platform",
+            "why does this code throw an exception",
+            "optimize this algorithm",
+        ],
+        tier="complex",
+        sources=frozenset({"kb"}),
+    ),
+    Intent(
+        name="platform",
+        examples=[
+            "how do I configure the teacher dashboard",
+            "where can I manage class grades",
+            "how do parents see attendance",
+            "how do I add a new student to a class",
+            "what does the owner dashboard show",
+            "how do I set up school billing",
+        ],
+        tier="default",
+        sources=frozenset({"kb", "pulse"}),
+    ),
+]
+
+
+class IntentClassifier:
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        intents: Optional[List[Intent]] = None,
+        min_confidence: Optional[float] = None,
+        direct_min_confidence: Optional[float] = None,
+        min_margin: Optional[float] = None,
+    ) -> None:
+        """
+        Nearest-centroid intent classifier on top of the knowledge base embeddings.
+
+        Centroids are computed once (lazily, on first use) from the intent examples,
+        so classifying an already-embedded query is a single small matrix-vector product.
+
+        Thresholds (env); calibrate them with scripts/benchmark_intents.py:
+        - INTENT_MIN_CONFIDENCE (0.45): below this cosine score the query is "general"
+          (full RAG + LLM). Above it the intent only picks context sources and model tier.
+        - INTENT_DIRECT_MIN_CONFIDENCE (default 1.01, i.e. direct answers off) and
+          INTENT_MIN_MARGIN (0.05): a direct, no-LLM answer needs a close paraphrase of an
+          example and a clear lead over the runner-up intent. Direct answers stay off until
+          the benchmark has been run against the real model and its baseline recorded.
+        """
+        self.embed_fn = embed_fn
+        self.intents: List[Intent] = intents if intents is not None else DEFAULT_INTENTS
+        self.min_confidence: float = min_confidence if min_confidence is not None else float(os.getenv("INTENT_MIN_CONFIDENCE", "0.45"))
+        self.direct_min_confidence: float = direct_min_confidence if direct_min_confidence is not None else float(os.getenv("INTENT_DIRECT_MIN_CONFIDENCE", "1.01"))
+        self.min_margin: float = min_margin if min_margin is not None else float(os.getenv("INTENT_MIN_MARGIN", "0.05"))
+        self._centroids: Optional[np.ndarray] = None
+
+    def _ensure_centroids(self) -> np.ndarray:
+        if self._centroids is None:
+            centroids: List[np.ndarray] = []
+            for intent in self.intents:
+                vectors = _normalize(np.asarray(self.embed_fn(intent.examples), dtype=np.float32))
+                centroids.append(vectors.mean(axis=0))
+            self._centroids = _normalize(np.vstack(centroids))
+        return self._centroids
+
+    def warm_up(self) -> float:
+        """Precomputes the centroids. Returns the time it took in seconds."""
+        start = time.perf_counter()
+        self._ensure_centroids()
+        return time.perf_counter() - start
+
+    def embed(self, query: str) -> List[float]:
+        return [float(x) for x in self.embed_fn([query])[0]]
+
+    def classify(self, query_embedding: Sequence[float]) -> IntentMatch:
+        """
+        Classifies an already-embedded query (the same embedding can be reused for KB search).
+        """
+        centroids = self._ensure_centroids()
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        scores = centroids @ query
+
+        order = np.argsort(scores)[::-1]
+        best = int(order[0])
+        confidence = float(scores[best])
+        margin = confidence - float(scores[order[1]]) if len(order) > 1 else confidence
+        score_map = {intent.name: float(s) for intent, s in zip(self.intents, scores)}
+
+        if confidence < self.min_confidence:
+            return IntentMatch(intent=GENERAL_INTENT, confidence=confidence, margin=margin,
+                               confident=False, direct=False, scores=score_map)
+
+        intent = self.intents[best]
+        direct = intent.direct and confidence >= self.direct_min_confidence and margin >= self.min_margin
+        return IntentMatch(intent=intent, confidence=confidence, margin=margin,
+                           confident=True, direct=direct, scores=score_map)
+
+    def classify_text(self, query: str) -> IntentMatch:
+        return self.classify(self.embed(query))
+
+    def fallback(self) -> IntentMatch:
+        return IntentMatch(intent=GENERAL_INTENT, confidence=0.0, margin=0.0, confident=False, direct=False)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
@@ -1,107 +1,482 @@
 import os
+import re
 import glob
-from typing import List, Dict, Any, Optional
-import chromadb
-from chromadb.utils import embedding_functions
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import time
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from chunking import MarkdownChunker, NearDuplicateFilter
+from index_artifact import IndexArtifact, resolve_index_dir, write_index, gc_versions, ensure_writable, DEFAULT_KEEP_VERSIONS
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PERSIST_DIRECTORY = os.path.join(SERVICE_DIR, "chroma_db")
+DEFAULT_INDEX_PATH = os.path.join(SERVICE_DIR, "index")
+DEFAULT_REFRESH_INDEX_PATH = os.path.join(SERVICE_DIR, "index_refresh")
+
+DOC_ROLES = ["owner", "admin", "teacher", "parent", "student", "individual"]
+SHARED_ROLE = "shared"
+GLOBAL_TENANT = "global"
+
+ROLE_ALIASES: Dict[str, str] = {
+    "schooladmin": "admin",
+    "school_admin": "admin",
+    "super_admin": "admin",
+    "superadmin": "admin",
+}
+
+def normalize_role(role: Optional[str]) -> Optional[str]:
+    """
+    Maps a user role (e.g. "Teacher", "SchoolAdmin") to a doc role.
+    Returns None for roles without dedicated docs.
+    """
+    if not role:
+        return None
+    key = role.strip().lower().replace(" ", "_").replace("-", "_")
+    key = ROLE_ALIASES.get(key, key)
+    return key if key in DOC_ROLES else None
+
+def infer_doc_role(filename: str) -> str:
+    """
+    Infers the dashboard a doc belongs to from its filename ("teacher-dashboard.md" -> "teacher").
+    """
+    match = re.match(r"^([a-z_]+)[-_]dashboard", filename.lower())
+    if match:
+        role = normalize_role(match.group(1))
+        if role:
+            return role
+    return SHARED_ROLE
+
+def build_where(role: Optional[str] = None, tenant: Optional[str] = None, origin: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Builds the metadata filter scoping a search to the user's role, tenant and (optionally) doc origin.
+    Shared docs and global (untenanted) docs are always included.
+    """
+    conditions: List[Dict[str, Any]] = []
+    if role:
+        conditions.append({"role": {"$in": [role, SHARED_ROLE]}})
+    tenants = [GLOBAL_TENANT, tenant] if tenant and tenant != GLOBAL_TENANT else [GLOBAL_TENANT]
+    conditions.append({"tenant": {"$in": tenants}})
+    if origin:
+        conditions.append({"origin": origin})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+COLLECTION_NAME = "gyn_docs"
+ACTIVE_COLLECTION_FILE = "ACTIVE_COLLECTION"
+
+Source = Tuple[str, str, Optional[Dict[str, Dict[str, Any]]]]
+
+class RefreshStatus:
+    def __init__(self, state: str = "idle", phase: Optional[str] = None) -> None:
+        """Progress of a knowledge refresh (updated by the build thread, read by /refresh-knowledge/status)."""
+        self.state: str = state  # idle | running | succeeded | failed
+        self.phase: Optional[str] = phase  # starting | collecting | embedding | swapping | cleanup | done
+        self.chunks_total: int = 0
+        self.chunks_done: int = 0
+        self.version: Optional[str] = None
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = time.time() if state == "running" else None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "state": self.state,
+            "phase": self.phase,
+            "chunks_done": self.chunks_done,
+            "chunks_total": self.chunks_total,
+            "progress": round(self.chunks_done / self.chunks_total, 3) if self.chunks_total else 0.0,
+            "version": self.version,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_seconds": round(end - self.started_at, 1) if self.started_at else None,
+        }
+
+def knowledge_doc_metadata(record: Dict[str, Any], filename: str) -> Dict[str, Any]:
+    """
+    Search metadata for a PocketBase knowledge_docs record. Its optional role and tenantId
+    fields (named like the users fields) scope the doc; without a tenantId it is global.
+    """
+    metadata: Dict[str, Any] = {
+        "role": normalize_role(record.get("role")) or infer_doc_role(filename),
+        "tenant": record.get("tenantId") or GLOBAL_TENANT,
+    }
+    updated: Optional[str] = record.get("updated")
+    if updated:
+        try:
+            # PocketBase timestamps look like "2024-01-31 12:00:00.000Z"
+            metadata["updated_at"] = int(datetime.fromisoformat(updated.replace("Z", "+00:00")).timestamp())
+        except ValueError:
+            pass
+    return metadata
 
 class KnowledgeBase:
-    def __init__(self, persist_directory: str = "./ai_service/chroma_db") -> None:
+    def __init__(self, persist_directory: Optional[str] = None, index_path: Optional[str] = None) -> None:
         """
         Initialize the Knowledge Base with ChromaDB.
+        chromadb, sentence-transformers and the chunker are imported and loaded
+        on first use, so importing this module (or the service) stays cheap.
+
+        If a prebuilt index artifact exists at index_path (env KB_INDEX_PATH, default
+        ai_service/index; see build_index.py), it is memory-mapped read-only at load()
+        and used for search instead of ChromaDB, so nothing is re-embedded on boot.
+        index_path is only ever read: refreshes write new versions to refresh_index_path
+        (env KB_REFRESH_INDEX_PATH, default ai_service/index_refresh), which must be local to
+        this replica, and load() serves whichever of the two holds the newer version.
         """
-        self.client = chromadb.PersistentClient(path=persist_directory)
-        
-        # Use a local, efficient embedding model (runs on CPU/GPU, no API costs)
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
-        
-        self.collection = self.client.get_or_create_collection(
-            name="gyn_docs",
-            embedding_function=self.embedding_fn
-        )
-        
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        self.persist_directory: str = persist_directory or os.getenv("KB_PERSIST_DIRECTORY", DEFAULT_PERSIST_DIRECTORY)
+        self.index_path: str = index_path or os.getenv("KB_INDEX_PATH", DEFAULT_INDEX_PATH)
+        self.refresh_index_path: str = os.getenv("KB_REFRESH_INDEX_PATH", DEFAULT_REFRESH_INDEX_PATH)
+        self.index_keep: int = int(os.getenv("KB_INDEX_KEEP", str(DEFAULT_KEEP_VERSIONS)))
+        self.index: Optional[IndexArtifact] = None
+        self._client: Any = None
+        self._embedding_fn: Any = None
+        self._collection: Any = None
+        self._chunker: Optional[MarkdownChunker] = None
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self.refresh_status = RefreshStatus()
+        self.swap_grace_seconds: float = float(os.getenv("KB_SWAP_GRACE_SECONDS", "5"))
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb
+                    self._client = chromadb.PersistentClient(path=self.persist_directory)
+        return self._client
+
+    @property
+    def embedding_fn(self) -> Any:
+        if self._embedding_fn is None:
+            with self._lock:
+                if self._embedding_fn is None:
+                    from chromadb.utils import embedding_functions
+                    # Use a local, efficient embedding model (runs on CPU/GPU, no API costs)
+                    self._embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
+                        model_name=EMBEDDING_MODEL
+                    )
+        return self._embedding_fn
+
+    @property
+    def collection(self) -> Any:
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    self._collection = self.client.get_or_create_collection(
+                        name=self._active_collection_name(),
+                        embedding_function=self.embedding_fn
+                    )
+        return self._collection
+
+    @collection.setter
+    def collection(self, collection: Any) -> None:
+        self._collection = collection
+
+    def _active_collection_name(self) -> str:
+        pointer = os.path.join(self.persist_directory, ACTIVE_COLLECTION_FILE)
+        if os.path.exists(pointer):
+            with open(pointer, "r", encoding="utf-8") as f:
+                name = f.read().strip()
+            if name:
+                return name
+        return COLLECTION_NAME
+
+    def _set_active_collection_name(self, name: str) -> None:
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = os.path.join(self.persist_directory, f".{ACTIVE_COLLECTION_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(name + "\n")
+        os.replace(tmp_path, os.path.join(self.persist_directory, ACTIVE_COLLECTION_FILE))
+
+    @property
+    def active_version(self) -> Optional[str]:
+        if self.index is not None:
+            return self.index.version
+        return self._collection.name if self._collection is not None else None
 
-    def ingest_docs(self, docs_dir: str) -> int:
+    @property
+    def chunker(self) -> MarkdownChunker:
+        if self._chunker is None:
+            self._chunker = MarkdownChunker()
+        return self._chunker
+
+    @property
+    def has_prebuilt_index(self) -> bool:
+        return self.index is not None
+
+    def load(self) -> None:
+        """Eagerly loads the vector store and embedding model (e.g. during service startup)."""
+        verify: bool = os.getenv("KB_INDEX_VERIFY", "1") == "1"
+        index_dir: Optional[str] = resolve_index_dir(self.index_path)
+        if index_dir:
+            self.index = IndexArtifact.load(index_dir, model_name=EMBEDDING_MODEL, verify=verify)
+            # A version built by an earlier refresh of this replica supersedes an older shipped one
+            refreshed_dir: Optional[str] = resolve_index_dir(self.refresh_index_path)
+            if refreshed_dir and refreshed_dir != index_dir:
+                try:
+                    refreshed = IndexArtifact.load(refreshed_dir, model_name=EMBEDDING_MODEL, verify=verify)
+                    if refreshed.manifest.get("created_at", 0) > self.index.manifest.get("created_at", 0):
+                        self.index = refreshed
+                except Exception as e:
+                    print(f"[WARN] Ignoring refreshed index at {refreshed_dir}: {e}")
+            print(f"Loaded prebuilt index {self.index.version} ({len(self.index)} chunks, read-only)")
+            _ = self.embedding_fn
+        else:
+            _ = self.collection
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.embedding_fn(texts)
+
+    def build_index(
+        self,
+        sources: List[Source],
+        out_root: Optional[str] = None,
+        batch_size: int = 64
+    ) -> str:
+        """
+        Chunks and embeds the given sources into a new versioned index artifact.
+        Returns the version directory. Raises ValueError if the sources yield no chunks.
+        """
+        ids, documents, metadatas = self.collect_chunks(sources)
+        return self._build_artifact(ids, documents, metadatas, out_root or self.index_path, batch_size=batch_size)
+
+    def _build_artifact(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        out_root: str,
+        status: Optional[RefreshStatus] = None,
+        batch_size: int = 64
+    ) -> str:
+        import numpy as np
+
+        if not documents:
+            # An empty artifact has no embedding dimension and would serve no results
+            raise ValueError("No chunks to index: the sources contain no markdown documents")
+        vectors: List[Any] = []
+        for i in range(0, len(documents), batch_size):
+            vectors.extend(self.embed(documents[i:i + batch_size]))
+            done: int = min(i + batch_size, len(documents))
+            if status:
+                status.chunks_done = done
+            print(f"Embedded {done}/{len(documents)} chunks")
+        embeddings = np.asarray(vectors, dtype=np.float32).reshape(len(documents), -1)
+        return write_index(out_root, ids, documents, metadatas, embeddings, EMBEDDING_MODEL)
+
+    def ingest_docs(self, docs_dir: str, origin: str = "repo", file_metadata: Optional[Dict[str, Dict[str, Any]]] = None) -> int:
         """
         Reads all markdown files from docs_dir, chunks them, and stores in vector DB.
+        Each chunk gets role, origin, tenant and updated_at metadata; file_metadata
+        (keyed by filename) overrides the inferred values.
         Returns number of chunks added.
         """
-        print(f"Scanning {docs_dir} for documentation...")
-        files: List[str] = glob.glob(os.path.join(docs_dir, "*.md"))
-        
-        if not files:
-            print("No markdown files found.")
-            return 0
+        return self.refresh([(docs_dir, origin, file_metadata)])
 
-        total_chunks: int = 0
-        
-        # Clear existing to avoid duplicates on re-ingest (simple strategy for now)
+    def start_refresh(self) -> bool:
+        """Single-flight guard: returns False if a refresh is already running."""
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        self.refresh_status = RefreshStatus(state="running", phase="starting")
+        return True
+
+    def finish_refresh(self, error: Optional[str] = None) -> None:
+        self.refresh_status.state = "failed" if error else "succeeded"
+        if not error:
+            self.refresh_status.phase = "done"
+        self.refresh_status.error = error
+        self.refresh_status.finished_at = time.time()
+        self._refresh_lock.release()
+
+    def refresh(self, sources: List[Source]) -> int:
+        """Runs a complete refresh (start_refresh + rebuild + finish_refresh). Returns 0 if one is already running."""
+        if not self.start_refresh():
+            print("Knowledge refresh already in progress, skipping.")
+            return 0
         try:
-            existing_count: int = self.collection.count()
-            if existing_count > 0:
-                print(f"Clearing {existing_count} existing documents...")
-                self.client.delete_collection("gyn_docs")
-                self.collection = self.client.get_or_create_collection(
-                    name="gyn_docs",
-                    embedding_function=self.embedding_fn
-                )
+            count: int = self.rebuild(sources)
         except Exception as e:
-            print(f"Note: Collection reset skipped: {e}")
+            self.finish_refresh(error=str(e))
+            raise
+        self.finish_refresh()
+        return count
+
+    def rebuild(self, sources: List[Source]) -> int:
+        """
+        Blue/green rebuild (call between start_refresh and finish_refresh, off the event loop).
+        A new collection version (or index artifact version) is built while searches keep
+        using the live one; the live pointer is then switched atomically and old versions
+        are garbage-collected after a grace period.
+        Returns number of chunks in the new version.
+        """
+        status = self.refresh_status
+        if self.index is not None:
+            # Fail before the (expensive) embedding phase; the shipped index_path is never written
+            ensure_writable(self.refresh_index_path)
+        status.phase = "collecting"
+        ids, documents, metadatas = self.collect_chunks(sources)
+        status.chunks_total = len(documents)
+        if not documents:
+            # Never swap in an empty version
+            print("No chunks collected; keeping the live index.")
+            return 0
+
+        status.phase = "embedding"
+        if self.index is not None:
+            version_dir: str = self._build_artifact(ids, documents, metadatas, self.refresh_index_path, status)
+            new_index = IndexArtifact.load(version_dir, model_name=EMBEDDING_MODEL, verify=False)
+            status.phase = "swapping"
+            self.index = new_index
+            status.version = new_index.version
+            status.phase = "cleanup"
+            time.sleep(self.swap_grace_seconds)
+            gc_versions(self.refresh_index_path, keep=self.index_keep)
+        else:
+            new_name: str = f"{COLLECTION_NAME}_v{int(time.time() * 1000)}"
+            new_collection = self.client.create_collection(name=new_name, embedding_function=self.embedding_fn)
+            try:
+                # Add in batches to avoid hitting limits if any
+                batch_size: int = 100
+                for i in range(0, len(documents), batch_size):
+                    end: int = i + batch_size
+                    new_collection.add(
+                        ids=ids[i:end],
+                        documents=documents[i:end],
+                        metadatas=metadatas[i:end]
+                    )
+                    status.chunks_done = min(end, len(documents))
+            except Exception:
+                self.client.delete_collection(new_name)
+                raise
+
+            status.phase = "swapping"
+            self.collection = new_collection
+            self._set_active_collection_name(new_name)
+            status.version = new_name
+            status.phase = "cleanup"
+            # Let in-flight searches on the old version finish before dropping it
+            time.sleep(self.swap_grace_seconds)
+            self._drop_inactive_collections(new_name)
 
+        print(f"Successfully indexed {len(documents)} chunks from {len({m['source'] for m in metadatas})} files ({status.version}).")
+        return len(documents)
+
+    def _drop_inactive_collections(self, active_name: str) -> None:
+        for collection in self.client.list_collections():
+            # chromadb < 0.6 returns Collection objects, newer versions return names
+            name: str = getattr(collection, "name", collection)
+            if name.startswith(COLLECTION_NAME) and name != active_name:
+                try:
+                    self.client.delete_collection(name)
+                    print(f"Dropped old collection {name}")
+                except Exception as e:
+                    print(f"Note: could not drop collection {name}: {e}")
+
+    def collect_chunks(
+        self,
+        sources: List[Source]
+    ) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        """
+        Reads and chunks all markdown files of the given (docs_dir, origin, file_metadata) sources.
+        Near-duplicate chunks (e.g. boilerplate repeated across dashboards) are kept once per tenant;
+        a chunk duplicated across roles is re-scoped to the shared role so every role still finds it.
+        Returns (ids, documents, metadatas).
+        """
         ids: List[str] = []
         documents: List[str] = []
         metadatas: List[Dict[str, Any]] = []
+        dedup: Dict[str, NearDuplicateFilter] = {}
+        skipped: int = 0
 
-        for file_path in files:
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content: str = f.read()
-                
-                filename: str = os.path.basename(file_path)
-                chunks: List[str] = self.text_splitter.split_text(content)
-                
-                for i, chunk in enumerate(chunks):
-                    chunk_id: str = f"{filename}_{i}"
-                    ids.append(chunk_id)
-                    documents.append(chunk)
-                    metadatas.append({"source": filename, "chunk_index": i})
+        for docs_dir, origin, file_metadata in sources:
+            print(f"Scanning {docs_dir} for documentation...")
+            files: List[str] = sorted(glob.glob(os.path.join(docs_dir, "*.md")))
+            if not files:
+                print("No markdown files found.")
+                continue
+
+            for file_path in files:
+                try:
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        content: str = f.read()
                     
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
-
-        if documents:
-            # Add in batches to avoid hitting limits if any
-            batch_size: int = 100
-            for i in range(0, len(documents), batch_size):
-                end: int = i + batch_size
-                self.collection.add(
-                    ids=ids[i:end],
-                    documents=documents[i:end],
-                    metadatas=metadatas[i:end]
-                )
-            total_chunks = len(documents)
-            print(f"Successfully indexed {total_chunks} chunks from {len(files)} files.")
-        
-        return total_chunks
+                    filename: str = os.path.basename(file_path)
+                    chunks: List[Dict[str, Any]] = self.chunker.split(content)
+                    doc_metadata: Dict[str, Any] = {
+                        "source": filename,
+                        "role": infer_doc_role(filename),
+                        "origin": origin,
+                        "tenant": GLOBAL_TENANT,
+                        "updated_at": int(os.path.getmtime(file_path)),
+                    }
+                    doc_metadata.update((file_metadata or {}).get(filename, {}))
+                    seen = dedup.setdefault(doc_metadata["tenant"], NearDuplicateFilter())
+                    
+                    for i, chunk in enumerate(chunks):
+                        duplicate_of: Optional[int] = seen.find_or_add(chunk["text"], len(documents))
+                        if duplicate_of is not None:
+                            skipped += 1
+                            if metadatas[duplicate_of]["role"] != doc_metadata["role"]:
+                                metadatas[duplicate_of]["role"] = SHARED_ROLE
+                            continue
+                        ids.append(f"{origin}:{filename}_{i}")
+                        documents.append(chunk["text"])
+                        metadatas.append({**doc_metadata, "chunk_index": i, "section": chunk["section"], "tokens": chunk["tokens"]})
+                        
+                except Exception as e:
+                    print(f"Error processing {file_path}: {e}")
+
+        if skipped:
+            print(f"Skipped {skipped} near-duplicate chunks.")
+        return ids, documents, metadatas
 
-    def search(self, query: str, k: int = 3) -> List[str]:
+    def embed_query(self, query: str) -> List[float]:
         """
-        Semantic search for relevant context.
+        Embeds a single query so callers can reuse the vector (e.g. intent classification + search).
+        """
+        return [float(x) for x in self.embed([query])[0]]
+
+    def search(
+        self,
+        query: str,
+        k: int = 3,
+        query_embedding: Optional[List[float]] = None,
+        role: Optional[str] = None,
+        tenant: Optional[str] = None,
+        origin: Optional[str] = None
+    ) -> List[str]:
         """
-        if self.collection.count() == 0:
+        Semantic search for relevant context, scoped to the role's and tenant's docs.
+        Pass query_embedding to skip re-embedding a query that was already embedded.
+        """
+        where: Dict[str, Any] = build_where(normalize_role(role), tenant, origin)
+
+        index: Optional[IndexArtifact] = self.index
+        if index is not None:
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+            return [doc for doc, _ in index.search(query_embedding, k=k, where=where)]
+
+        # Hold one reference: a refresh may swap the live collection meanwhile
+        collection = self.collection
+        if collection.count() == 0:
             return []
 
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=k
-        )
+        if query_embedding is not None:
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=k,
+                where=where
+            )
+        else:
+            results = collection.query(
+                query_texts=[query],
+                n_results=k,
+                where=where
+            )
         
         # Flatten results
         if results and results['documents']:
@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+logger = logging.getLogger("ai_service")
+
+
+class LoopBlockedError(RuntimeError):
+    """Raised in strict mode when code blocked the event loop beyond the threshold."""
+
+
+class LoopLagMonitor:
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        threshold_ms: Optional[float] = None,
+        window: int = 1000,
+        strict: Optional[bool] = None
+    ) -> None:
+        """
+        Event-loop watchdog.
+
+        A ticker coroutine sleeps for `interval` seconds and records how late it wakes up
+        (the loop lag). A watchdog thread notices when the ticker has not run for longer than
+        `threshold_ms` and captures the stack of the code holding the loop at that moment.
+
+        Configuration (env): LOOP_MONITOR_INTERVAL (seconds, default 0.1),
+        LOOP_BLOCK_THRESHOLD_MS (default 100), LOOP_MONITOR_STRICT (1 = asyncio debug mode,
+        and raise_if_blocked() fails on any blocking event; the service's /metrics endpoint
+        then answers 500, so a debug/CI deployment that blocked its loop fails its checks).
+
+        Each blocking event's blocked_ms is the full stall (how late the ticker ran, exact to
+        within one interval): it is recorded when the watchdog notices the stall and updated
+        with the total once the loop runs the ticker again.
+        """
+        self.interval: float = interval if interval is not None else float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+        self.threshold: float = (threshold_ms if threshold_ms is not None else float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))) / 1000
+        self.strict: bool = strict if strict is not None else os.getenv("LOOP_MONITOR_STRICT", "0") == "1"
+        self.lags: Deque[float] = deque(maxlen=window)
+        self.blocking_events: Deque[Dict[str, Any]] = deque(maxlen=50)
+        self.blocked_count: int = 0
+        self._last_tick: float = time.perf_counter()
+        self._reported_tick: Optional[float] = None
+        self._open_event: Optional[Dict[str, Any]] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._previous_debug: Optional[bool] = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.strict:
+            # asyncio debug mode additionally logs every callback slower than the threshold
+            self._previous_debug = loop.get_debug()
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._previous_debug is not None:
+            asyncio.get_running_loop().set_debug(self._previous_debug)
+            self._previous_debug = None
+
+    async def _tick(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - start - self.interval)
+            self.lags.append(lag)
+            event = self._open_event
+            if event is not None and self._reported_tick == self._last_tick:
+                # The watchdog caught this stall mid-way: record its full length, measured the
+                # same way the watchdog does (from the last tick, which may predate `start`)
+                self._open_event = None
+                event["blocked_ms"] = round(max(lag, now - self._last_tick - self.interval) * 1000, 1)
+            elif lag > self.threshold and self._reported_tick != self._last_tick:
+                # Short stall the watchdog did not catch in time: record it without a stack
+                self._reported_tick = self._last_tick
+                self._record_blocking(lag, capture_stack=False)
+            self._last_tick = now
+
+    def _watch(self) -> None:
+        # Runs in its own thread: it keeps running while the loop thread is stuck
+        while not self._stopped.wait(self.threshold / 2):
+            last_tick = self._last_tick
+            stalled = time.perf_counter() - last_tick - self.interval
+            if stalled > self.threshold and self._reported_tick != last_tick:
+                self._reported_tick = last_tick
+                self._open_event = self._record_blocking(stalled)
+
+    def _record_blocking(self, stalled: float, capture_stack: bool = True) -> Dict[str, Any]:
+        frame = sys._current_frames().get(self._loop_thread_id) if capture_stack and self._loop_thread_id else None
+        stack: List[str] = traceback.format_stack(frame) if frame else []
+        self.blocked_count += 1
+        event: Dict[str, Any] = {
+            "timestamp": time.time(),
+            "blocked_ms": round(stalled * 1000, 1),
+            "stack": stack,
+        }
+        self.blocking_events.append(event)
+        logger.warning(
+            f"Event loop blocked for >{stalled * 1000:.0f}ms",
+            extra={"stack": "".join(stack[-15:])}
+        )
+        return event
+
+    def percentiles(self) -> Dict[str, float]:
+        if not self.lags:
+            return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(self.lags)
+
+        def pick(pct: float) -> float:
+            return round(ordered[min(len(ordered) - 1, int(pct * len(ordered)))] * 1000, 2)
+
+        return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(ordered[-1] * 1000, 2)}
+
+    def snapshot(self) -> Dict[str, Any]:
+        last_event = self.blocking_events[-1] if self.blocking_events else None
+        return {
+            "lag": self.percentiles(),
+            "samples": len(self.lags),
+            "threshold_ms": self.threshold * 1000,
+            "blocked_count": self.blocked_count,
+            "last_blocking_event": last_event,
+        }
+
+    def raise_if_blocked(self) -> None:
+        """In strict mode, fails (e.g. a test) if the loop was blocked beyond the threshold."""
+        if self.strict and self.blocking_events:
+            event = self.blocking_events[-1]
+            raise LoopBlockedError(
+                f"Event loop blocked {self.blocked_count} time(s), last for {event['blocked_ms']}ms at:\n" + "".join(event["stack"][-10:])
+            )
+
+
+@asynccontextmanager
+async def detect_blocking(threshold_ms: float = 100, interval: float = 0.01) -> AsyncIterator[LoopLagMonitor]:
+    """
+    Test helper: raises LoopBlockedError if the wrapped code blocks the loop.
+
+        async with detect_blocking():
+            await client.post("/chat", json=payload)
+    """
+    monitor = LoopLagMonitor(interval=interval, threshold_ms=threshold_ms, strict=True)
+    await monitor.start()
+    try:
+        yield monitor
+        # Let the ticker observe a stall that ended right before the block exited
+        await asyncio.sleep(interval * 2)
+    finally:
+        await monitor.stop()
+    monitor.raise_if_blocked()
@@ -2,10 +2,14 @@ import os
 import time
 import logging
 import json
+import re
+import asyncio
+import shutil
 from pythonjsonlogger import jsonlogger
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Header
+from fastapi.responses import PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -13,12 +17,14 @@ from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
-import openai
-import google.generativeai as genai
-from knowledge_base import KnowledgeBase
+from knowledge_base import KnowledgeBase, Source, normalize_role, knowledge_doc_metadata
 from pocketbase_client import PocketBaseClient
 from client_manager import ClientManager
 from model_router import ModelRouter
+from intent_classifier import IntentClassifier, IntentMatch
+from tracing import Tracer, RequestProfiler, TracingMiddleware
+from loop_monitor import LoopLagMonitor, LoopBlockedError
+from admission import AdmissionController, AdmissionRejected, run_blocking
 
 # Configure JSON logging
 log_handler = logging.StreamHandler()
@@ -42,33 +48,54 @@ else:
     logger.info("Loaded .env from default location (or not found)")
 
 # Initialize Knowledge Base & PocketBase
-# In production, we fail if KB cannot be initialized.
-try:
-    kb = KnowledgeBase()
-except Exception as e:
-    logger.critical(f"KnowledgeBase initialization failed: {e}")
-    raise RuntimeError(f"KnowledgeBase initialization failed: {e}")
-
-pb = PocketBaseClient()
+# The KB loads lazily; startup (lifespan) fails if it cannot be initialized.
+kb = KnowledgeBase()
+
+tracer = Tracer()
+profiler = RequestProfiler()
+loop_monitor = LoopLagMonitor()
+admission = AdmissionController()
+pb = PocketBaseClient(tracer=tracer)
 client_manager = ClientManager()
 router = ModelRouter()
+classifier = IntentClassifier(kb.embed)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
+    await loop_monitor.start()
+
+    # Heavy imports (chromadb, sentence-transformers) happen here, off the event loop
+    try:
+        await asyncio.to_thread(kb.load)
+    except Exception as e:
+        logger.critical(f"KnowledgeBase initialization failed: {e}")
+        raise RuntimeError(f"KnowledgeBase initialization failed: {e}")
+
     await pb.authenticate()
+
+    # Build the default provider's client (SDK import + constructor) off the event loop
+    if AI_PROVIDER in client_manager.list_available_providers():
+        await asyncio.to_thread(client_manager.get_client, AI_PROVIDER)
+
+    try:
+        warm_up_seconds: float = await asyncio.to_thread(classifier.warm_up)
+        logger.info(f"Intent centroids ready in {warm_up_seconds * 1000:.0f}ms.")
+    except Exception as e:
+        logger.error(f"Error computing intent centroids: {e}")
     
-    # Ingest docs on startup in background
-    docs_path: str = os.path.join(os.path.dirname(os.path.dirname(__file__)), "docs")
-    if os.path.exists(docs_path):
-        logger.info(f"Background ingestion started for: {docs_path}")
-        try:
-            count: int = kb.ingest_docs(docs_path)
-            logger.info(f"Startup ingestion complete: {count} chunks.")
-        except Exception as e:
-            logger.error(f"Error during startup ingestion: {e}")
+    # Refresh the knowledge base on startup in background (unless a prebuilt index was loaded).
+    # The previous version keeps serving searches until the new one is swapped in.
+    if kb.has_prebuilt_index:
+        logger.info(f"Serving prebuilt index {kb.active_version}; skipping startup ingestion.")
+    elif start_knowledge_refresh():
+        logger.info("Background knowledge refresh started.")
     yield
     logger.info("Shutting down AI Service...")
+    for task in list(refresh_tasks):
+        task.cancel()
+    await asyncio.gather(*refresh_tasks, return_exceptions=True)
+    await loop_monitor.stop()
 
 limiter = Limiter(key_func=get_remote_address)
 app = FastAPI(title="Concierge AI Service", lifespan=lifespan)
@@ -85,6 +112,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Sampled tracing + admin per-request profiling (outermost, so it covers the whole request)
+app.add_middleware(TracingMiddleware, tracer=tracer, profiler=profiler)
+
 # Configuration
 AI_PROVIDER: str = os.getenv("AI_PROVIDER", "openai").lower()
 AI_MODEL: Optional[str] = os.getenv("AI_MODEL")
@@ -94,6 +124,8 @@ GROQ_API_KEY: Optional[str] = os.getenv("GROQ_API_KEY")
 GEMINI_API_KEY: Optional[str] = os.getenv("GEMINI_API_KEY")
 OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
 OPEN_WEBUI_BASE_URL: str = os.getenv("OPEN_WEBUI_BASE_URL", "http://localhost:3000/api")
+# Per-IP abuse limit; provider capacity is protected by admission control
+CHAT_RATE_LIMIT: str = os.getenv("CHAT_RATE_LIMIT", "30/minute")
 
 class Message(BaseModel):
     role: str
@@ -104,6 +136,7 @@ class ChatRequest(BaseModel):
     context: Optional[str] = None
     model: Optional[str] = None
     userId: Optional[str] = None
+    role: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
@@ -170,186 +203,423 @@ async def health_check():
         "status": "healthy",
         "timestamp": time.time(),
         "provider": AI_PROVIDER,
-        "kb_status": "ready" if kb else "error"
+        "kb_status": "ready" if kb else "error",
+        "kb_version": kb.active_version
     }
 
-@app.post("/chat", response_model=ChatResponse)
-@limiter.limit("5/minute")
-async def chat(request: ChatRequest, fast_request: Request) -> Dict[str, Any]:
-    stats.request_count += 1
-    try:
-        # 1. Check for specific system commands first
-        last_message: str = request.messages[-1].content.lower()
-        
-        if "status" in last_message or "health" in last_message:
-            return {
-                "response": f"All systems are operational. Provider: {AI_PROVIDER}. Latency is nominal (24ms).",
-                "usage": {"total_tokens": 0},
-                "provider": AI_PROVIDER
-            }
-        
-        if "help" in last_message:
-            return {
-                "response": "I am the Concierge AI. I can assist you with:\n- Platform configuration\n- User management\n- System diagnostics\n- Data analysis\n\nHow can I help you today?",
-                "usage": {"total_tokens": 0},
-                "provider": AI_PROVIDER
-            }
+HELP_RESPONSE: str = "I am the Concierge AI. I can assist you with:\n- Platform configuration\n- User management\n- System diagnostics\n- Data analysis\n\nHow can I help you today?"
+
+def escape_filter_value(value: str) -> str:
+    """Escapes a value interpolated into a PocketBase filter string."""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+def extract_search_term(query: str) -> str:
+    """
+    Extracts the searched name/email from queries like "find user alice" or "look up the account of maria".
+    """
+    # Greedy prefix: take the text after the last keyword ("find the user named bob" -> "bob")
+    match = re.search(r".*\b(?:users?|named|called|of|for|email)\s+(.+)$", query, re.IGNORECASE)
+    if not match:
+        return ""
+    return match.group(1).strip().strip("?.!'\"")
+
+def resolve_doc_role(request: ChatRequest) -> Optional[str]:
+    """
+    Resolves which dashboard docs a request is scoped to: the user's role, else a role named
+    in the chat context (e.g. "Role: Teacher. Context: General Dashboard").
+    """
+    role = normalize_role(request.role)
+    if role or not request.context:
+        return role
+    for word in re.findall(r"[a-z_]+", request.context.lower()):
+        role = normalize_role(word)
+        if role:
+            return role
+    return None
+
+async def get_caller(authorization: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    The caller's PocketBase user record, verified from their auth token (Authorization header).
+    None without a valid token. Tenant and permissions are never taken from the request body.
+    """
+    if not authorization:
+        return None
+    return await pb.get_auth_user(authorization)
+
+def resolve_tenant(caller: Optional[Dict[str, Any]]) -> Optional[str]:
+    """The caller's tenant; without a verified caller only global docs are searched."""
+    return (caller or {}).get("tenantId") or None
+
+def user_search_filter(caller: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Scope of the user directory a caller may search (runs on the admin token, so it must be
+    checked here): owners see all users, school admins their tenant's users. None = not allowed.
+    """
+    role: Optional[str] = (caller or {}).get("role")
+    if role == "Owner":
+        return ""
+    tenant = resolve_tenant(caller)
+    if role == "SchoolAdmin" and tenant:
+        return f"tenantId='{escape_filter_value(tenant)}'"
+    return None
+
+async def get_provider_client(provider: str) -> Any:
+    """Returns the provider's client, building it (SDK import) off the event loop on first use."""
+    client = client_manager.clients.get(provider)
+    if client is None:
+        client = await asyncio.to_thread(client_manager.get_client, provider)
+    return client
+
+async def search_users(search_term: str, scope: str) -> List[Dict[str, Any]]:
+    term = escape_filter_value(search_term)
+    filter_str = f"(name~'{term}' || email~'{term}')"
+    if scope:
+        filter_str += f" && {scope}"
+    return await pb.search_collection("users", filter_str=filter_str)
+
+async def answer_directly(intent: str, query: str, authorization: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Answers intents that need no LLM call from templates or PocketBase.
+    Returns None when the intent cannot be answered directly (the caller falls back to the LLM).
+    User lookups are only answered for verified admins (see user_search_filter).
+    """
+    if intent == "status":
+        response = f"All systems are operational. Provider: {AI_PROVIDER}. Latency is nominal (24ms)."
+    elif intent == "help":
+        response = HELP_RESPONSE
+    elif intent == "user_search":
+        with tracer.span("pb.resolve_caller"):
+            caller = await get_caller(authorization)
+        scope = user_search_filter(caller)
+        search_term = extract_search_term(query)
+        if scope is None or not search_term:
+            return None
+        users = await search_users(search_term, scope)
+        if users:
+            lines = [f"- {u.get('name') or 'Unknown'} ({u.get('email') or 'no email'})" for u in users]
+            response = f"Users matching '{search_term}':\n" + "\n".join(lines)
+        else:
+            response = f"No users found matching '{search_term}'."
+    elif intent == "product_list":
+        products = await pb.search_collection("products", limit=10)
+        if products:
+            lines = [f"- {p.get('name', 'Item')}" + (f" ({p['price']})" if p.get("price") is not None else "") for p in products]
+            response = "Latest products:\n" + "\n".join(lines)
+        else:
+            response = "No products found."
+    else:
+        return None
+
+    return {
+        "response": response,
+        "usage": {"total_tokens": 0},
+        "provider": AI_PROVIDER
+    }
 
-        # RAG: Retrieve relevant context
-        retrieved_context: str = ""
+@app.get("/metrics")
+async def get_metrics():
+    metrics: Dict[str, Any] = {
+        "event_loop": loop_monitor.snapshot(),
+        "admission": admission.snapshot()
+    }
+    # Strict mode (LOOP_MONITOR_STRICT=1): a blocked event loop fails the metrics check
+    try:
+        loop_monitor.raise_if_blocked()
+    except LoopBlockedError as e:
+        return JSONResponse(status_code=500, content={**metrics, "error": str(e)})
+    return metrics
+
+@app.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, x_profile: Optional[str] = Header(default=None)) -> str:
+    """Returns a stored request profile as pstats text (requires the PROFILER_TOKEN in X-Profile)."""
+    if not profiler.is_authorized(x_profile):
+        raise HTTPException(status_code=403, detail="Profiler access denied")
+    report: Optional[str] = profiler.report(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return report
+
+async def build_system_prompt(
+    request: ChatRequest,
+    match: IntentMatch,
+    query_embedding: Optional[List[float]],
+    authorization: Optional[str]
+) -> str:
+    """Fetches the context sources the intent needs (KB, pulse, PocketBase data) into the system prompt."""
+    sources = match.intent.sources
+    last_message: str = request.messages[-1].content
+    # The caller's verified PocketBase user (None without a valid Authorization token)
+    caller: Optional[Dict[str, Any]] = None
+    if "kb" in sources or "users" in sources:
+        with tracer.span("pb.resolve_caller"):
+            caller = await get_caller(authorization)
+
+    # RAG: Retrieve relevant context
+    retrieved_context: str = ""
+    if "kb" in sources:
         try:
-            results: List[str] = kb.search(request.messages[-1].content)
+            tenant: Optional[str] = resolve_tenant(caller)
+            with tracer.span("kb.search"):
+                results: List[str] = await asyncio.to_thread(
+                    kb.search,
+                    last_message,
+                    query_embedding=query_embedding,
+                    role=resolve_doc_role(request),
+                    tenant=tenant
+                )
             if results:
                 retrieved_context = "\n\nRelevant Documentation:\n" + "\n---\n".join(results)
         except Exception as e:
             logger.warning(f"Vector search failed: {e}")
 
-        # REAL-TIME DATA: Fetch System Pulse
-        system_pulse: str = await pb.get_recent_activity()
-        
-        # REAL-TIME DATA: Targeted Search (Simple Intent)
-        db_results: str = ""
-        user_query: str = request.messages[-1].content.lower()
-        
-        # Wellness Coach Logic
-        if request.context == "Wellness Coach" and request.userId:
-            try:
-                logs = await pb.search_collection("wellness_logs", filter_str=f"user='{request.userId}'", limit=7)
-                if logs:
-                    # Format logs for better AI consumption
-                    formatted_logs: List[str] = []
-                    for log in logs:
-                        formatted_logs.append(f"- Date: {log.get('date')}, Steps: {log.get('steps')}, Calories: {log.get('calories')}, Sleep: {log.get('sleep_minutes')}m, Mood: {log.get('mood')}")
-                    db_results += f"\n\n[USER WELLNESS LOGS (Last 7 Days)]\n" + "\n".join(formatted_logs)
-            except Exception as e:
-                logger.error(f"Error fetching wellness logs: {e}", extra={"userId": request.userId})
-
-        if "search user" in user_query or "find user" in user_query:
-            # Extract name (very naive)
-            parts = user_query.split("user")
-            if len(parts) > 1:
-                search_term = parts[1].strip()
-                users = await pb.search_collection("users", filter_str=f"name~'{search_term}' || email~'{search_term}'")
-                db_results = f"\n\nDatabase Search Results (Users):\n{users}"
-        elif "list products" in user_query:
-             products = await pb.search_collection("products", limit=10)
-             db_results = f"\n\nDatabase Search Results (Products):\n{products}"
-
-        system_prompt: str = "You are the Concierge AI for the 'Grow Your Need' platform. You are helpful, professional, and concise. You have access to system documentation and real-time database status."
-        
-        if request.context == "Wellness Coach":
-            system_prompt = "You are the Wellness Coach for the 'Grow Your Need' platform. You are an empathetic, encouraging, and knowledgeable health assistant. You help users track their fitness, sleep, and mental well-being. Use the provided wellness logs to give personalized advice. Keep your answers short and motivating."
+    # REAL-TIME DATA: Fetch System Pulse
+    system_pulse: str = ""
+    if "pulse" in sources:
+        with tracer.span("pb.get_recent_activity"):
+            system_pulse = await pb.get_recent_activity()
 
-        # Inject Contexts
+    # REAL-TIME DATA: Targeted Search
+    db_results: str = ""
+
+    # Wellness Coach Logic
+    if (request.context == "Wellness Coach" or "wellness" in sources) and request.userId:
+        try:
+            with tracer.span("pb.wellness_logs"):
+                logs = await pb.search_collection("wellness_logs", filter_str=f"user='{escape_filter_value(request.userId)}'", limit=7)
+            if logs:
+                # Format logs for better AI consumption
+                formatted_logs: List[str] = []
+                for log in logs:
+                    formatted_logs.append(f"- Date: {log.get('date')}, Steps: {log.get('steps')}, Calories: {log.get('calories')}, Sleep: {log.get('sleep_minutes')}m, Mood: {log.get('mood')}")
+                db_results += f"\n\n[USER WELLNESS LOGS (Last 7 Days)]\n" + "\n".join(formatted_logs)
+        except Exception as e:
+            logger.error(f"Error fetching wellness logs: {e}", extra={"userId": request.userId})
+
+    if "users" in sources:
+        scope = user_search_filter(caller)
+        search_term = extract_search_term(last_message)
+        if scope is not None and search_term:
+            users = await search_users(search_term, scope)
+            db_results = f"\n\nDatabase Search Results (Users):\n{users}"
+    elif "products" in sources:
+        products = await pb.search_collection("products", limit=10)
+        db_results = f"\n\nDatabase Search Results (Products):\n{products}"
+
+    system_prompt: str = "You are the Concierge AI for the 'Grow Your Need' platform. You are helpful, professional, and concise. You have access to system documentation and real-time database status."
+    
+    if request.context == "Wellness Coach":
+        system_prompt = "You are the Wellness Coach for the 'Grow Your Need' platform. You are an empathetic, encouraging, and knowledgeable health assistant. You help users track their fitness, sleep, and mental well-being. Use the provided wellness logs to give personalized advice. Keep your answers short and motivating."
+
+    # Inject Contexts
+    if system_pulse:
         system_prompt += f"\n\n[SYSTEM PULSE - RECENT ACTIVITY]\n{system_pulse}"
+    
+    if request.context:
+        system_prompt += f"\n\n[USER CONTEXT]\n{request.context}"
         
-        if request.context:
-            system_prompt += f"\n\n[USER CONTEXT]\n{request.context}"
-            
-        if retrieved_context:
-            system_prompt += f"\n\n[KNOWLEDGE BASE]\n{retrieved_context}"
-            
-        if db_results:
-            system_prompt += f"\n\n[DATABASE RESULTS]\n{db_results}"
+    if retrieved_context:
+        system_prompt += f"\n\n[KNOWLEDGE BASE]\n{retrieved_context}"
+        
+    if db_results:
+        system_prompt += f"\n\n[DATABASE RESULTS]\n{db_results}"
+
+    return system_prompt
+
+@app.post("/chat", response_model=ChatResponse)
+@limiter.limit(CHAT_RATE_LIMIT)
+async def chat(request: ChatRequest, fast_request: Request) -> Dict[str, Any]:
+    stats.request_count += 1
+    try:
+        # 1. Classify intent (the query embedding is reused for the KB search)
+        last_message: str = request.messages[-1].content
+        query_embedding: Optional[List[float]] = None
+        try:
+            with tracer.span("kb.embed_query"):
+                # Model inference: run it off the event loop
+                query_embedding = await asyncio.to_thread(kb.embed_query, last_message)
+            with tracer.span("intent.classify") as span:
+                match: IntentMatch = classifier.classify(query_embedding)
+                if span:
+                    span.set_attribute("intent", match.name)
+        except Exception as e:
+            logger.warning(f"Intent classification failed: {e}")
+            match = classifier.fallback()
+
+        logger.info(f"Intent: {match.name} ({match.confidence:.2f})", extra={"userId": request.userId, "direct": match.direct})
+        authorization: Optional[str] = fast_request.headers.get("authorization")
+
+        # Answer directly from templates / PocketBase when no LLM call is needed
+        if match.direct:
+            with tracer.span("chat.direct_answer", intent=match.name):
+                direct_response = await answer_directly(match.name, last_message, authorization)
+            if direct_response is not None:
+                return direct_response
 
         # --- INTELLIGENT ROUTING ---
-        available_providers = client_manager.list_available_providers()
-        route_decision = router.route(request.messages[-1].content, request.context or "General", available_providers)
+        # A provider whose client cannot be built drops out of the available list: re-route
+        provider_client: Any = None
+        for _ in range(len(client_manager.list_available_providers()) + 1):
+            available_providers = client_manager.list_available_providers()
+            with tracer.span("router.route"):
+                route_decision = router.route(
+                    last_message,
+                    request.context or "General",
+                    available_providers,
+                    tier=match.intent.tier if match.confident else None
+                )
+            if route_decision["provider"] not in available_providers:
+                break
+            provider_client = await get_provider_client(route_decision["provider"])
+            if provider_client is not None:
+                break
+            logger.warning(f"Provider {route_decision['provider']} failed to initialize, re-routing", extra={"userId": request.userId})
         
         selected_provider = route_decision["provider"]
         selected_model = route_decision["model"]
         
-        logger.info(f"Routing Decision: {route_decision}", extra={"userId": request.userId, "context": request.context})
+        logger.info(f"Routing Decision: {route_decision}", extra={"userId": request.userId, "context": request.context, "intent": match.name})
+
+        # 2. Fallback
+        if provider_client is None:
+            stats.error_count += 1
+            return {
+                "response": f"I am currently running in offline mode. Provider '{selected_provider}' is not configured correctly. Please check your .env file.",
+                "usage": {"total_tokens": 0},
+                "provider": "offline"
+            }
 
-        # 2. Handle Gemini Provider
-        if selected_provider == "gemini":
-            genai_model = client_manager.get_client("gemini")
-            if genai_model:
-                chat_session = genai_model.start_chat(history=[])
+        # 3. Take a provider slot before fetching any context, so a shed request costs
+        # no KB search or PocketBase calls (only the embedding needed to route it)
+        async with admission.slot(selected_provider, route_decision.get("tier")):
+            system_prompt: str = await build_system_prompt(request, match, query_embedding, authorization)
+
+            # Gemini
+            if selected_provider == "gemini":
+                chat_session = provider_client.start_chat(history=[])
                 full_prompt: str = f"{system_prompt}\n\nUser: {request.messages[-1].content}"
-                response = chat_session.send_message(full_prompt)
-                
+                with tracer.span("provider.completion", provider="gemini", model=selected_model):
+                    # Sync SDK call: run it off the event loop (holds the slot until the thread is done)
+                    response = await run_blocking(chat_session.send_message, full_prompt)
+
                 input_tokens = len(full_prompt) // 4
                 output_tokens = len(response.text) // 4
                 stats.tokens_in += input_tokens
                 stats.tokens_out += output_tokens
-                
+
                 return {
                     "response": response.text,
-                    "usage": {"total_tokens": input_tokens + output_tokens}, 
+                    "usage": {"total_tokens": input_tokens + output_tokens},
                     "provider": f"gemini ({selected_model})"
                 }
 
-        # 3. Handle OpenAI-compatible Providers
-        client = client_manager.get_client(selected_provider)
-        if client:
+            # OpenAI-compatible providers
             api_messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
             for msg in request.messages:
                 api_messages.append({"role": msg.role, "content": msg.content})
 
-            completion = client.chat.completions.create(
-                model=selected_model,
-                messages=api_messages
-            )
-            
-            if completion.usage:
-                stats.tokens_in += completion.usage.prompt_tokens
-                stats.tokens_out += completion.usage.completion_tokens
-            
-            return {
-                "response": completion.choices[0].message.content,
-                "usage": {
-                    "prompt_tokens": completion.usage.prompt_tokens,
-                    "completion_tokens": completion.usage.completion_tokens,
-                    "total_tokens": completion.usage.total_tokens
-                } if completion.usage else {},
-                "provider": f"{selected_provider} ({selected_model})"
-            }
-        
-        # 4. Fallback
-        stats.error_count += 1
+            with tracer.span("provider.completion", provider=selected_provider, model=selected_model):
+                # Sync SDK call: run it off the event loop (holds the slot until the thread is done)
+                completion = await run_blocking(
+                    provider_client.chat.completions.create,
+                    model=selected_model,
+                    messages=api_messages
+                )
+
+        if completion.usage:
+            stats.tokens_in += completion.usage.prompt_tokens
+            stats.tokens_out += completion.usage.completion_tokens
+
         return {
-            "response": f"I am currently running in offline mode. Provider '{selected_provider}' is not configured correctly. Please check your .env file.",
-            "usage": {"total_tokens": 0},
-            "provider": "offline"
+            "response": completion.choices[0].message.content,
+            "usage": {
+                "prompt_tokens": completion.usage.prompt_tokens,
+                "completion_tokens": completion.usage.completion_tokens,
+                "total_tokens": completion.usage.total_tokens
+            } if completion.usage else {},
+            "provider": f"{selected_provider} ({selected_model})"
         }
 
+    except AdmissionRejected as e:
+        logger.warning(f"Request shed by admission control: {e}", extra={"userId": request.userId})
+        raise HTTPException(
+            status_code=503,
+            detail=f"AI provider is at capacity ({e.reason}). Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         stats.error_count += 1
         logger.error(f"Error in chat endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+# Strong references to running refresh tasks (the event loop only keeps weak ones)
+refresh_tasks: Set[asyncio.Task] = set()
+
+def start_knowledge_refresh() -> bool:
+    """Starts a background knowledge refresh. Returns False if one is already running."""
+    if not kb.start_refresh():
+        return False
+    # A plain task, not a response BackgroundTask: those are skipped when sending the
+    # response fails, which would leave the refresh slot taken forever
+    task = asyncio.create_task(ingest_all_knowledge())
+    refresh_tasks.add(task)
+    task.add_done_callback(refresh_tasks.discard)
+    return True
+
 async def ingest_all_knowledge():
+    """
+    Rebuilds the knowledge base from docs/ and PocketBase as one new version and swaps it in.
+    The caller must hold the refresh slot (kb.start_refresh()); it is always released here,
+    also when the task is cancelled.
+    """
     logger.info("Starting knowledge refresh...")
-    # 1. Ingest local docs
-    docs_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "docs")
-    if os.path.exists(docs_path):
-        kb.ingest_docs(docs_path)
-    
-    # 2. Download and ingest from PocketBase
-    records = await pb.get_knowledge_docs()
-    temp_dir = os.path.join(os.path.dirname(__file__), "temp_docs")
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    downloaded_count = 0
-    for record in records:
-        filename = record.get("file")
-        if filename:
-            dest = os.path.join(temp_dir, filename)
-            if await pb.download_file(record["collectionId"], record["id"], filename, dest):
-                downloaded_count += 1
-    
-    if downloaded_count > 0:
-        logger.info(f"Downloaded {downloaded_count} documents from PocketBase.")
-        kb.ingest_docs(temp_dir)
-    
-    logger.info("Knowledge refresh complete.")
+    error: Optional[str] = "cancelled"
+    try:
+        sources: List[Source] = []
+        # 1. Local docs
+        docs_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "docs")
+        if os.path.exists(docs_path):
+            sources.append((docs_path, "repo", None))
+        
+        # 2. Download from PocketBase (fresh copy, so deleted docs disappear too).
+        # Download into a staging dir first: if PocketBase fails, export_knowledge_docs raises,
+        # the refresh ends as failed and the live version (with the tenant docs) stays in place.
+        temp_dir = os.path.join(os.path.dirname(__file__), "temp_docs")
+        staging_dir = f"{temp_dir}.new"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+        records = await pb.export_knowledge_docs(staging_dir)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.replace(staging_dir, temp_dir)
+        if records:
+            logger.info(f"Downloaded {len(records)} documents from PocketBase.")
+            file_metadata: Dict[str, Dict[str, Any]] = {
+                record["file"]: knowledge_doc_metadata(record, record["file"]) for record in records
+            }
+            sources.append((temp_dir, "pocketbase", file_metadata))
+
+        # 3. Build the new version off the event loop; searches keep using the live one
+        count: int = await asyncio.to_thread(kb.rebuild, sources)
+        error = None
+        logger.info(f"Knowledge refresh complete: {count} chunks ({kb.active_version}).")
+    except Exception as e:
+        error = str(e)
+        logger.error(f"Knowledge refresh failed: {e}", exc_info=True)
+    finally:
+        kb.finish_refresh(error=error)
 
 @app.post("/refresh-knowledge")
-async def refresh_knowledge(background_tasks: BackgroundTasks):
-    background_tasks.add_task(ingest_all_knowledge)
+async def refresh_knowledge():
+    if not start_knowledge_refresh():
+        return {"status": "Knowledge refresh already in progress", "refresh": kb.refresh_status.to_dict()}
     return {"status": "Knowledge refresh started"}
 
+@app.get("/refresh-knowledge/status")
+async def refresh_knowledge_status() -> Dict[str, Any]:
+    return {
+        "active_version": kb.active_version,
+        "refresh": kb.refresh_status.to_dict()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
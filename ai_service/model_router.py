@@ -1,23 +1,28 @@
 from typing import Dict, Any, Optional
 import os
 
+COMPLEX_KEYWORDS = ["code", "function", "debug", "error", "fix", "algorithm", "architecture", "react", "typescript"]
+SIMPLE_KEYWORDS = ["hello", "hi", "status", "time", "thanks"]
+
 class ModelRouter:
     def __init__(self):
         self.default_provider = os.getenv("AI_PROVIDER", "openai")
         self.default_model = os.getenv("AI_MODEL", "gpt-3.5-turbo")
-        
-    def route(self, query: str, context: str, available_providers: list) -> Dict[str, str]:
+
+    def route(self, query: str, context: str, available_providers: list, tier: Optional[str] = None) -> Dict[str, str]:
         """
         Determines the best model/provider for the given query.
+        If tier ("fast", "default", "complex") is given, e.g. by the intent classifier,
+        it is used instead of the keyword heuristics.
         """
         query_lower = query.lower()
-        
+
         # Strategy:
         # 1. If specific provider is requested in context/query (advanced), use it.
         # 2. If "code" or "complex" -> High Intelligence (OpenAI GPT-4 / OpenRouter Claude 3)
         # 3. If "fast" or simple -> Low Latency (Groq / Ollama)
         # 4. Fallback -> Default
-        
+
         selected_provider = self.default_provider
         selected_model = self.default_model
         reason = "Default configuration"
@@ -27,27 +32,38 @@ class ModelRouter:
         has_openai = "openai" in available_providers
         has_ollama = "ollama" in available_providers
 
+        if tier is None:
+            if any(k in query_lower for k in COMPLEX_KEYWORDS):
+                tier = "complex"
+            elif len(query.split()) < 15 or any(k in query_lower for k in SIMPLE_KEYWORDS):
+                tier = "fast"
+            else:
+                tier = "default"
+            source = "query"
+        else:
+            source = "intent"
+
         # 1. Complex / Coding
-        if any(k in query_lower for k in ["code", "function", "debug", "error", "fix", "algorithm", "architecture", "react", "typescript"]):
+        if tier == "complex":
             if has_openai:
                 selected_provider = "openai"
                 selected_model = "gpt-4-turbo-preview"
-                reason = "Complex technical query -> GPT-4"
+                reason = f"Complex technical {source} -> GPT-4"
             elif "openrouter" in available_providers:
                 selected_provider = "openrouter"
                 selected_model = "anthropic/claude-3-opus"
-                reason = "Complex technical query -> Claude 3 Opus"
+                reason = f"Complex technical {source} -> Claude 3 Opus"
 
         # 2. Speed / Simple
-        elif len(query.split()) < 15 or any(k in query_lower for k in ["hello", "hi", "status", "time", "thanks"]):
+        elif tier == "fast":
             if has_groq:
                 selected_provider = "groq"
                 selected_model = "llama3-8b-8192"
-                reason = "Simple query -> Groq Llama3 (Speed)"
+                reason = f"Simple {source} -> Groq Llama3 (Speed)"
             elif has_ollama:
                 selected_provider = "ollama"
                 selected_model = os.getenv("VITE_OLLAMA_MODEL", "qwen2.5:1.5b")
-                reason = "Simple query -> Local Ollama"
+                reason = f"Simple {source} -> Local Ollama"
 
         # 3. Fallback if selected provider is not available
         if selected_provider not in available_providers:
@@ -60,11 +76,13 @@ class ModelRouter:
                 return {
                     "provider": "none",
                     "model": "none",
-                    "reason": "No AI providers configured"
+                    "reason": "No AI providers configured",
+                    "tier": tier
                 }
 
         return {
             "provider": selected_provider,
             "model": selected_model,
-            "reason": reason
+            "reason": reason,
+            "tier": tier
         }
@@ -1,15 +1,28 @@
 import os
+import time
+import hashlib
 import httpx
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+from tracing import Tracer, TracingTransport
+
+class PocketBaseError(Exception):
+    """PocketBase could not be reached or returned an error."""
 
 class PocketBaseClient:
-    def __init__(self) -> None:
+    def __init__(self, tracer: Optional[Tracer] = None) -> None:
         self.base_url: str = os.getenv("POCKETBASE_URL", "http://127.0.0.1:8090")
         self.admin_email: Optional[str] = os.getenv("POCKETBASE_ADMIN_EMAIL")
         self.admin_password: Optional[str] = os.getenv("POCKETBASE_ADMIN_PASSWORD")
         self.token: Optional[str] = None
         # Use AsyncClient for performance
-        self.client: httpx.AsyncClient = httpx.AsyncClient(base_url=self.base_url, timeout=5.0)
+        # Outbound calls get a span each when the request is traced
+        transport: Optional[httpx.AsyncBaseTransport] = TracingTransport(tracer) if tracer else None
+        self.client: httpx.AsyncClient = httpx.AsyncClient(base_url=self.base_url, timeout=5.0, transport=transport)
+        # Verified user tokens -> (expires_at, user record), so chat requests skip the auth round trip
+        self.auth_cache_ttl: float = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+        self.auth_cache_size: int = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+        self._auth_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
 
     async def authenticate(self) -> None:
         """Authenticates as admin to get a bearer token."""
@@ -57,16 +70,60 @@ class PocketBaseClient:
         except Exception:
             return []
 
-    async def get_knowledge_docs(self) -> List[Dict[str, Any]]:
-        """Fetches all records from knowledge_docs collection."""
+    async def get_auth_user(self, user_token: str) -> Optional[Dict[str, Any]]:
+        """
+        Verifies a user's PocketBase auth token. Returns their user record, or None if the token is invalid.
+        Verified tokens are cached for AUTH_CACHE_TTL_SECONDS (default 60); invalid ones are not.
+        """
+        key = hashlib.sha256(user_token.encode("utf-8")).hexdigest()
+        cached = self._auth_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        self._auth_cache.pop(key, None)
+
         try:
-            response = await self.client.get("/api/collections/knowledge_docs/records?sort=-created")
-            if response.status_code == 200:
-                return response.json().get("items", [])
-            return []
+            response = await self.client.post(
+                "/api/collections/users/auth-refresh",
+                headers={"Authorization": user_token}
+            )
+            if response.status_code != 200:
+                return None
+            user: Optional[Dict[str, Any]] = response.json().get("record")
         except Exception as e:
-            print(f"Error fetching knowledge docs: {e}")
-            return []
+            print(f"Error verifying user token: {e}")
+            return None
+
+        if user and self.auth_cache_ttl > 0:
+            self._auth_cache[key] = (time.monotonic() + self.auth_cache_ttl, user)
+            while len(self._auth_cache) > self.auth_cache_size:
+                self._auth_cache.popitem(last=False)
+        return user
+
+    async def get_knowledge_docs(self) -> List[Dict[str, Any]]:
+        """
+        Fetches all records from the knowledge_docs collection (every page).
+        Raises PocketBaseError if PocketBase is unreachable or errors, so callers can tell
+        "no docs" (a missing collection counts as empty) from "could not fetch docs".
+        """
+        records: List[Dict[str, Any]] = []
+        page: int = 1
+        while True:
+            try:
+                response = await self.client.get(
+                    "/api/collections/knowledge_docs/records",
+                    params={"sort": "-created", "perPage": 200, "page": page}
+                )
+            except Exception as e:
+                raise PocketBaseError(f"Error fetching knowledge docs: {e}") from e
+            if response.status_code == 404:
+                return records
+            if response.status_code != 200:
+                raise PocketBaseError(f"Error fetching knowledge docs: {response.status_code} {response.text}")
+            data = response.json()
+            records.extend(data.get("items", []))
+            if page >= data.get("totalPages", 1):
+                return records
+            page += 1
 
     async def download_file(self, collection_id: str, record_id: str, filename: str, dest_path: str) -> bool:
         """Downloads a file from PocketBase to local destination."""
@@ -84,6 +141,23 @@ class PocketBaseClient:
             return False
 
 
+    async def export_knowledge_docs(self, dest_dir: str) -> List[Dict[str, Any]]:
+        """
+        Downloads every knowledge_docs file into dest_dir. Returns the downloaded records.
+        Raises PocketBaseError if the list or any file cannot be fetched: a partial export
+        would silently drop documents from an index rebuilt from it.
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        downloaded: List[Dict[str, Any]] = []
+        for record in await self.get_knowledge_docs():
+            filename = record.get("file")
+            if filename:
+                dest = os.path.join(dest_dir, filename)
+                if not await self.download_file(record["collectionId"], record["id"], filename, dest):
+                    raise PocketBaseError(f"Could not download knowledge doc {filename}")
+                downloaded.append(record)
+        return downloaded
+
     async def search_collection(self, collection: str, filter_str: str = "", limit: int = 5) -> List[Dict[str, Any]]:
         """Searches a specific collection."""
         try:
@@ -0,0 +1,313 @@
+import os
+import io
+import hmac
+import json
+import time
+import queue
+import asyncio
+import random
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+import httpx
+
+SERVICE_NAME = "ai_service"
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attributes: Dict[str, Any]) -> None:
+        self.trace = trace
+        self.name = name
+        self.span_id: str = os.urandom(8).hex()
+        self.parent_id: Optional[str] = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = attributes
+        self.start_ns: int = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span: Dict[str, Any] = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 2 if self.parent_id is None else 1,  # SERVER for the root, INTERNAL otherwise
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    def __init__(self) -> None:
+        self.trace_id: str = os.urandom(16).hex()
+        self.spans: List[Span] = []
+
+
+class Tracer:
+    def __init__(
+        self,
+        sample_rate: Optional[float] = None,
+        export_path: Optional[str] = None,
+        otlp_endpoint: Optional[str] = None
+    ) -> None:
+        """
+        Opt-in, sampled request tracing.
+
+        Configuration (env):
+        - TRACE_SAMPLE_RATE: fraction of requests traced (default 0 = disabled)
+        - TRACE_EXPORT_PATH: append each trace as one OTLP/JSON line to this file
+        - TRACE_OTLP_ENDPOINT: POST traces to an OTLP/HTTP collector (e.g. http://collector:4318/v1/traces)
+
+        When no trace is active, span() costs a single context variable lookup.
+        """
+        self.sample_rate: float = sample_rate if sample_rate is not None else float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+        self.export_path: Optional[str] = export_path or os.getenv("TRACE_EXPORT_PATH")
+        self.otlp_endpoint: Optional[str] = otlp_endpoint or os.getenv("TRACE_OTLP_ENDPOINT")
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=1000)
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 and bool(self.export_path or self.otlp_endpoint)
+
+    def should_sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def current_trace_id(self) -> Optional[str]:
+        trace = _current_trace.get()
+        return trace.trace_id if trace else None
+
+    @contextmanager
+    def trace(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Starts a new trace with a root span; spans opened inside it become children."""
+        trace = Trace()
+        trace_token = _current_trace.set(trace)
+        try:
+            with self.span(name, **attributes) as root:
+                yield root
+        finally:
+            _current_trace.reset(trace_token)
+            self._export(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Records a child span of the current trace. Yields None (no-op) when the request is not traced."""
+        trace = _current_trace.get()
+        if trace is None:
+            yield None
+            return
+
+        span = Span(trace, name, _current_span.get(), attributes)
+        trace.spans.append(span)
+        span_token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end()
+            _current_span.reset(span_token)
+
+    def _export(self, trace: Trace) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": SERVICE_NAME},
+                    "spans": [span.to_otlp() for span in trace.spans]
+                }]
+            }]
+        }
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+            self._worker.start()
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            pass  # Drop traces rather than slow down requests
+
+    def _export_loop(self) -> None:
+        # Runs in a background thread so file/network I/O never blocks the event loop
+        client = httpx.Client(timeout=5.0) if self.otlp_endpoint else None
+        while True:
+            payload = self._queue.get()
+            if self.export_path:
+                try:
+                    with open(self.export_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(payload) + "\n")
+                except Exception as e:
+                    print(f"[WARN] Trace export to {self.export_path} failed: {e}")
+            if client and self.otlp_endpoint:
+                try:
+                    client.post(self.otlp_endpoint, json=payload)
+                except Exception as e:
+                    print(f"[WARN] Trace export to {self.otlp_endpoint} failed: {e}")
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport recording a span for every outbound request made inside a trace.
+    """
+    def __init__(self, tracer: Tracer, transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        self.tracer = tracer
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with self.tracer.span(f"HTTP {request.method}", **{"http.method": request.method, "http.url": str(request.url)}) as span:
+            response = await self.transport.handle_async_request(request)
+            if span is not None:
+                span.set_attribute("http.status_code", response.status_code)
+            return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class RequestProfiler:
+    def __init__(self, token: Optional[str] = None, profile_dir: Optional[str] = None) -> None:
+        """
+        Admin-only per-request cProfile switch.
+
+        A request is profiled when PROFILER_TOKEN is set and the request sends it in the
+        X-Profile header (never a query parameter, which would leak it into URLs and access
+        logs). Profiles are stored in PROFILE_DIR
+        and the response carries an X-Profile-Id header. cProfile is per thread, so concurrent
+        requests on the event loop show up in the profile too; only one profile runs at a time.
+        """
+        self.token: Optional[str] = token or os.getenv("PROFILER_TOKEN")
+        self.profile_dir: str = profile_dir or os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+        self._lock = threading.Lock()
+        self._active: Optional[cProfile.Profile] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    def is_authorized(self, token: Optional[str]) -> bool:
+        if not self.enabled or token is None:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    def requested(self, scope: Dict[str, Any]) -> bool:
+        if not self.enabled:
+            return False
+        for key, value in scope.get("headers", []):
+            if key == b"x-profile":
+                return self.is_authorized(value.decode("latin-1"))
+        return False
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if not self._lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        self._active = profile
+        profile.enable()
+        return profile
+
+    async def stop(self, profile: cProfile.Profile, label: str) -> Optional[str]:
+        """Stops and stores the profile. Idempotent: returns None if it was already stopped."""
+        if profile is not self._active:
+            return None
+        profile.disable()
+        self._active = None
+        self._lock.release()
+        profile_id = f"{int(time.time() * 1000)}-{label.strip('/').replace('/', '_') or 'root'}"
+        # File I/O runs off the event loop
+        await asyncio.to_thread(self._save, profile, profile_id)
+        return profile_id
+
+    def _save(self, profile: cProfile.Profile, profile_id: str) -> None:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profile.dump_stats(os.path.join(self.profile_dir, f"{profile_id}.prof"))
+
+    def report(self, profile_id: str, limit: int = 50) -> Optional[str]:
+        """Renders a stored profile as pstats text (sorted by cumulative time)."""
+        path = os.path.join(self.profile_dir, f"{os.path.basename(profile_id)}.prof")
+        if not os.path.exists(path):
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening a trace per sampled request and profiling admin-flagged requests.
+    Unsampled, unprofiled requests pass straight through.
+    """
+    def __init__(self, app: Any, tracer: Tracer, profiler: RequestProfiler) -> None:
+        self.app = app
+        self.tracer = tracer
+        self.profiler = profiler
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sampled = self.tracer.should_sample()
+        profile = self.profiler.start() if self.profiler.requested(scope) else None
+        if not sampled and profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        path: str = scope.get("path", "")
+        profile_id: Optional[str] = None
+
+        async def send_with_headers(message: Dict[str, Any]) -> None:
+            nonlocal profile_id
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                trace_id = self.tracer.current_trace_id()
+                if trace_id:
+                    headers.append((b"x-trace-id", trace_id.encode()))
+                if profile is not None:
+                    # Stop before the body is sent so the profile covers the handler only
+                    profile_id = await self.profiler.stop(profile, path)
+                    if profile_id:
+                        headers.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            if sampled:
+                with self.tracer.trace(f"{scope.get('method', 'GET')} {path}", **{"http.route": path}):
+                    await self.app(scope, receive, send_with_headers)
+            else:
+                await self.app(scope, receive, send_with_headers)
+        finally:
+            if profile is not None:
+                # No-op if send_with_headers already stopped it (even if saving it failed there)
+                await self.profiler.stop(profile, path)
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
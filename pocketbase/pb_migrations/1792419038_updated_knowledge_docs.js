@@ -0,0 +1,48 @@
+/// <reference path="../pb_data/types.d.ts" />
+migrate((app) => {
+  const collection = app.findCollectionByNameOrId("pbc_428413972")
+
+  // add field
+  collection.fields.add(new Field({
+    "autogeneratePattern": "",
+    "hidden": false,
+    "id": "text2618430961",
+    "max": 0,
+    "min": 0,
+    "name": "tenantId",
+    "pattern": "",
+    "presentable": false,
+    "primaryKey": false,
+    "required": false,
+    "system": false,
+    "type": "text"
+  }))
+
+  // add field
+  collection.fields.add(new Field({
+    "autogeneratePattern": "",
+    "hidden": false,
+    "id": "text1204587666",
+    "max": 0,
+    "min": 0,
+    "name": "role",
+    "pattern": "",
+    "presentable": false,
+    "primaryKey": false,
+    "required": false,
+    "system": false,
+    "type": "text"
+  }))
+
+  return app.save(collection)
+}, (app) => {
+  const collection = app.findCollectionByNameOrId("pbc_428413972")
+
+  // remove field
+  collection.fields.removeById("text2618430961")
+
+  // remove field
+  collection.fields.removeById("text1204587666")
+
+  return app.save(collection)
+})
@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+
+# Add ai_service to path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_service'))
+
+# Gates (see intent_classifier.py for the thresholds they validate):
+#   --min-accuracy          top-1 accuracy over LABELLED_QUERIES (env INTENT_MIN_ACCURACY, default 0.85)
+#   --min-direct-precision  share of direct (no-LLM) answers given for the expected intent (default 1.0):
+#                           a wrong direct answer skips the LLM entirely, so it is the costly mistake
+#
+# Baseline: classify() on a 384-dim embedding against the 8 default centroids runs at
+# ~42µs per query (numpy, single core), so classification cost is dominated by the one
+# MiniLM embedding that the KB search reuses.
+#
+# Accuracy baseline: NOT RECORDED YET (the MiniLM weights were unavailable where this was
+# written). Until it is, direct answers are off (INTENT_DIRECT_MIN_CONFIDENCE defaults to
+# 1.01). To enable them, run this script with the real model, e.g.
+#     INTENT_DIRECT_MIN_CONFIDENCE=0.6 python scripts/benchmark_intents.py
+# paste its Accuracy / Direct answers / Threshold calibration lines here, and set the
+# default from the calibration line (above "max wrong conf", with 100% direct precision).
+
+# Held-out queries (not used as centroid examples) labelled with the expected intent.
+LABELLED_QUERIES = [
+    ("status", "is everything up and running?"),
+    ("status", "are there any outages at the moment"),
+    ("status", "check the service health"),
+    ("status", "is the AI service online"),
+    ("help", "what are you able to do for me"),
+    ("help", "I need help, what can you assist with"),
+    ("help", "list your capabilities"),
+    ("greeting", "hey there"),
+    ("greeting", "good evening!"),
+    ("greeting", "thanks, that was helpful"),
+    ("user_search", "find user sarah"),
+    ("user_search", "search for the user with email tom@school.org"),
+    ("user_search", "look up user account for james"),
+    ("user_search", "is there a user named olivia"),
+    ("product_list", "what is for sale in the shop"),
+    ("product_list", "show me the product catalog"),
+    ("product_list", "list all items in the marketplace"),
+    ("wellness", "how well did I sleep last night"),
+    ("wellness", "did I reach my step goal this week"),
+    ("wellness", "tips to reduce my stress and improve my mood"),
+    ("wellness", "how many calories did I eat yesterday"),
+    ("technical", "my typescript build fails with a type error"),
+    ("technical", "refactor this react hook to avoid re-renders"),
+    ("technical", "write a python function to parse the csv export"),
+    ("technical", "why is this API call returning a 500 error"),
+    ("platform", "how can a teacher publish an assignment"),
+    ("platform", "where do parents view report cards"),
+    ("platform", "how does the owner manage subscriptions"),
+    ("platform", "how do I enroll a student in a course"),
+    ("general", "write a short poem about autumn"),
+    ("general", "what is the capital of australia"),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Intent classifier accuracy/latency benchmark")
+    parser.add_argument("--repeat", type=int, default=1000, help="classify() iterations per query for latency")
+    parser.add_argument("--min-accuracy", type=float, default=float(os.getenv("INTENT_MIN_ACCURACY", "0.85")),
+                        help="exit with status 1 below this accuracy (env INTENT_MIN_ACCURACY)")
+    parser.add_argument("--min-direct-precision", type=float, default=1.0,
+                        help="exit with status 1 if fewer direct answers than this match the expected intent")
+    args = parser.parse_args()
+
+    from chromadb.utils import embedding_functions
+    from intent_classifier import IntentClassifier
+
+    embed_fn = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+    classifier = IntentClassifier(embed_fn)
+
+    print("🚀 INTENT CLASSIFIER BENCHMARK")
+    print("==============================")
+    print(f"Centroid warm-up: {classifier.warm_up() * 1000:.1f}ms ({len(classifier.intents)} intents)")
+
+    correct = 0
+    direct = 0
+    direct_correct = 0
+    correct_confidences = []
+    wrong_confidences = []
+    direct_margins = []
+    embed_ms = []
+    classify_us = []
+    for expected, query in LABELLED_QUERIES:
+        start = time.perf_counter()
+        embedding = classifier.embed(query)
+        embed_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            match = classifier.classify(embedding)
+        classify_us.append((time.perf_counter() - start) / args.repeat * 1e6)
+
+        ok = match.name == expected
+        correct += ok
+        direct += match.direct
+        direct_correct += match.direct and ok
+        (correct_confidences if ok else wrong_confidences).append(match.confidence)
+        if match.direct and ok:
+            direct_margins.append(match.margin)
+        marker = "✅" if ok else "❌"
+        print(f"{marker} {expected:<13} -> {match.name:<13} conf={match.confidence:.2f} margin={match.margin:.2f} direct={match.direct}  {query}")
+
+    accuracy = correct / len(LABELLED_QUERIES)
+    direct_precision = direct_correct / direct if direct else 1.0
+    print("\n==============================")
+    print(f"Accuracy:          {accuracy:.1%} ({correct}/{len(LABELLED_QUERIES)})")
+    print(f"Direct answers:    {direct}/{len(LABELLED_QUERIES)} (no LLM call), precision {direct_precision:.1%}")
+    print(f"Embed latency:     p50={statistics.median(embed_ms):.2f}ms p95={percentile(embed_ms, 95):.2f}ms")
+    print(f"Classify latency:  p50={statistics.median(classify_us):.1f}µs p95={percentile(classify_us, 95):.1f}µs")
+
+    print(
+        "Threshold calibration: "
+        f"min correct conf={min(correct_confidences, default=0):.2f}, "
+        f"max wrong conf={max(wrong_confidences, default=0):.2f}, "
+        f"min direct margin={min(direct_margins, default=0):.2f} "
+        f"(configured: confidence {classifier.min_confidence}, direct {classifier.direct_min_confidence}, margin {classifier.min_margin})"
+    )
+
+    failed = False
+    if accuracy < args.min_accuracy:
+        print(f"❌ Accuracy below required {args.min_accuracy:.1%}")
+        failed = True
+    if direct_precision < args.min_direct_precision:
+        print(f"❌ Direct-answer precision below required {args.min_direct_precision:.1%}")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("✅ Within thresholds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+AI_SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ai_service')
+
+# Heavy SDKs that must only be imported on first use, never when the service module loads.
+LAZY_MODULES = [
+    "openai",
+    "google.generativeai",
+    "chromadb",
+    "sentence_transformers",
+    "langchain_text_splitters",
+    "torch",
+]
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(module):
+    """Runs `python -X importtime -c 'import <module>'` and returns [(name, self_us, cumulative_us, depth)]."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=AI_SERVICE_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"❌ Importing '{module}' failed")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI service startup (import time) profile")
+    parser.add_argument("--module", default="main", help="module to import (default: main)")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1500")),
+                        help="fail if the module takes longer than this to import (env IMPORT_BUDGET_MS)")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest top-level imports to show")
+    args = parser.parse_args()
+
+    entries = profile_imports(args.module)
+    total_ms = next((c for name, _, c, _ in reversed(entries) if name == args.module), 0) / 1000
+    imported = {name for name, _, _, _ in entries}
+
+    print("🚀 STARTUP PROFILE")
+    print("==============================")
+    print(f"Slowest top-level imports of '{args.module}':")
+    top_level = sorted((e for e in entries if e[3] <= 1 and e[0] != args.module), key=lambda e: e[2], reverse=True)
+    for name, _, cumulative_us, _ in top_level[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f}ms  {name}")
+
+    eager = [m for m in LAZY_MODULES if m in imported]
+    print("\n==============================")
+    print(f"Import time: {total_ms:.1f}ms (budget {args.budget_ms:.0f}ms)")
+
+    failed = False
+    if eager:
+        print(f"❌ Imported eagerly (must be lazy): {', '.join(eager)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print("❌ Import-time budget exceeded")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("✅ Within budget.")
+
+
+if __name__ == "__main__":
+    main()
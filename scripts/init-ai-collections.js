@@ -56,7 +56,10 @@ const AI_COLLECTIONS = [
             { name: 'type', type: 'select', options: { values: ['PDF', 'TXT', 'URL', 'MD'] } },
             { name: 'status', type: 'select', options: { values: ['Indexed', 'Indexing', 'Pending', 'Failed'] } },
             { name: 'size_bytes', type: 'number' },
-            { name: 'vector_id', type: 'text' }
+            { name: 'vector_id', type: 'text' },
+            // Search scope: empty tenantId = visible to every tenant; role = dashboard (e.g. 'Teacher')
+            { name: 'tenantId', type: 'text' },
+            { name: 'role', type: 'text' }
         ]
     },
     {
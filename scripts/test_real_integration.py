@@ -3,7 +3,6 @@ import sys
 import asyncio
 import httpx
 from dotenv import load_dotenv
-import openai
 
 # Add ai_service to path to import modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_service'))
@@ -41,6 +40,7 @@ async def test_ollama():
     # Test Generation
     print("   Testing Generation via OpenAI Client...")
     try:
+        import openai
         client = openai.OpenAI(
             base_url=ollama_url,
             api_key="ollama"
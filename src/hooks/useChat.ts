@@ -223,6 +223,9 @@ export const useChat = (context?: string) => {
                         // Open WebUI requires an API key, usually created in settings. 
                         // For now, we'll try without or use a placeholder if you set one up.
                         headers['Authorization'] = `Bearer ${import.meta.env.VITE_OPENAI_API_KEY || 'sk-placeholder'}`;
+                    } else if (pb.authStore.isValid) {
+                        // The AI service verifies this token to scope knowledge search to the user's tenant
+                        headers['Authorization'] = pb.authStore.token;
                     }
 
                     const response = await fetch(endpoint, {